@@ -1,3 +1,5 @@
+from datetime import timedelta
+from functools import partial
 from os import getenv, urandom
 
 from flask import Flask
@@ -9,16 +11,21 @@ from utils import generate_password
 DATABASE_URL = getenv("PC_MANAGER_DB_URL", "postgresql://localhost:5432/pc_manager")
 SECRET_KEY = getenv("PC_MANAGER_SECRET_KEY", urandom(32).hex())
 
+ENCRYPTION_KEYS = getenv("PC_MANAGER_ENCRYPTION_KEYS", f"0:{SECRET_KEY}")
+ENCRYPTION_KEY_ID = getenv("PC_MANAGER_ENCRYPTION_KEY_ID", "0")
+
 USERNAME = getenv("PC_MANAGER_USERNAME", "admin")
 PASSWORD = getenv("PC_MANAGER_PASSWORD") or generate_password()
 
-app = Flask(__name__)
-app.config["SECRET_KEY"] = SECRET_KEY
-app.config["MAX_CONTENT_LENGTH"] = 2 * 1000 * 1000
-app.config["SQLALCHEMY_DATABASE_URI"] = DATABASE_URL
-app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+DRAFT_TTL = int(getenv("PC_MANAGER_DRAFT_TTL", 24 * 60 * 60))
+
+# Commits only invalidate the cache of the worker that made them, so other workers
+# can serve stale reference data for up to the TTL. Disabled by default.
+REFERENCE_CACHE_TTL = int(getenv("PC_MANAGER_REFERENCE_CACHE_TTL", 0))
+
+RACE_STATUS_MANAGERS = getenv("PC_MANAGER_RACE_STATUS", "false").lower() == "true"
 
-db = SQLAlchemy(app)
+db = SQLAlchemy()
 auth = HTTPBasicAuth()
 
 
@@ -29,17 +36,99 @@ def authenticate(username, password):
     return (username == USERNAME) and (password == PASSWORD)
 
 
-from controller.credential import credentials
-from controller.custom_operation import custom_operations
-from controller.machine import machines
+def create_app():
+    app = Flask(__name__)
+    app.config["SECRET_KEY"] = SECRET_KEY
+    app.config["MAX_CONTENT_LENGTH"] = 2 * 1000 * 1000
+    app.config["SQLALCHEMY_DATABASE_URI"] = DATABASE_URL
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    db.init_app(app)
+
+    from controller.api import api
+    from controller.credential import credentials
+    from controller.custom_operation import custom_operations
+    from controller.job import jobs
+    from controller.machine import machines
+    from model.draft import Draft
+    from utils.draft_store import DraftSessionInterface
+
+    app.session_interface = DraftSessionInterface(
+        db, Draft, timedelta(seconds=DRAFT_TTL)
+    )
+
+    app.register_blueprint(api)
+    app.register_blueprint(credentials)
+    app.register_blueprint(custom_operations)
+    app.register_blueprint(jobs)
+    app.register_blueprint(machines)
+
+    app.before_first_request(partial(start_background_services, app))
+    app.cli.command("create-db", help="Create the database schema.")(create_db_command)
+    app.cli.command("upgrade-db", help="Upgrade an existing database schema.")(
+        upgrade_db_command
+    )
+    app.cli.command(
+        "run-status-poller", help="Poll machine statuses until interrupted."
+    )(run_status_poller_command)
+    app.add_url_rule("/info/health", view_func=healthcheck)
+    return app
+
+
+def start_background_services(app):
+    from utils.job_queue import job_queue
+
+    job_queue.resume(app)
+
+
+# Every WSGI worker runs the app factory, so the poller runs as its own process.
+def run_status_poller_command():
+    from flask import current_app
+
+    from utils.status_poller import status_poller
+
+    status_poller.serve(current_app._get_current_object())
+
+
+def create_db_command():
+    db.create_all()
+
+
+# create_all only creates missing tables, so add new columns, enum types, indexes
+# and changed defaults to tables created by older versions.
+CHANGED_DEFAULTS = [("job", "created_time", "now()")]
+
+
+def upgrade_db_command():
+    from sqlalchemy.schema import CreateColumn
 
-db.create_all()
+    db.create_all()
+    inspector = db.inspect(db.engine)
+    with db.engine.begin() as conn:
+        # Reflection skips expression indexes, so look the names up directly.
+        index_query = db.text("SELECT indexname FROM pg_indexes")
+        indexes = {name for (name,) in conn.execute(index_query)}
+        for table in db.metadata.sorted_tables:
+            columns = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in columns:
+                    continue
+                if isinstance(column.type, db.Enum):
+                    column.type.create(conn, checkfirst=True)
+                column_ddl = CreateColumn(column).compile(dialect=conn.dialect)
+                conn.execute(
+                    db.text(f"ALTER TABLE {table.name} ADD COLUMN {column_ddl}")
+                )
+            for index in table.indexes:
+                if index.name not in indexes:
+                    index.create(conn)
 
-app.register_blueprint(credentials)
-app.register_blueprint(custom_operations)
-app.register_blueprint(machines)
+        for table, column, default in CHANGED_DEFAULTS:
+            conn.execute(
+                db.text(
+                    f"ALTER TABLE {table} ALTER COLUMN {column} SET DEFAULT {default}"
+                )
+            )
 
 
-@app.route("/info/health")
 def healthcheck():
     return "", 204
@@ -0,0 +1,214 @@
+from hashlib import sha256
+
+from flask import Blueprint, Response, request, jsonify, abort
+from flask_marshmallow import Marshmallow
+from marshmallow import fields
+
+from app import auth
+from controller.custom_operation import CustomOperationSchema
+from controller.machine import MachineSchema, filter_machines
+from model.credential import Credential
+from model.custom_operation import CustomOperation
+from model.machine import Machine, SORT_COLUMNS
+from utils.pagination import paginate_keyset, PER_PAGE, MAX_PER_PAGE
+
+api = Blueprint("api", __name__, url_prefix="/api")
+
+ma = Marshmallow()
+
+
+class MachineApiSchema(MachineSchema):
+    id = fields.Integer()
+    version = fields.Integer()
+    last_status = fields.Function(lambda machine: machine.last_status.value)
+    last_status_time = fields.DateTime()
+    custom_operations = fields.Function(
+        lambda machine: [custom_op.id for custom_op in machine.custom_operations]
+    )
+
+
+class CredentialMetadataSchema(ma.Schema):
+    id = fields.Integer()
+    version = fields.Integer()
+    name = fields.Str()
+    type = fields.Str()
+    key_type = fields.Str(allow_none=True)
+
+
+class CustomOperationApiSchema(CustomOperationSchema):
+    id = fields.Integer()
+    version = fields.Integer()
+    plan = fields.Function(lambda custom_op: custom_op.get_plan())
+
+
+machine_api_schema = MachineApiSchema()
+credential_metadata_schema = CredentialMetadataSchema()
+custom_op_api_schema = CustomOperationApiSchema()
+
+
+def make_etag(kind, *parts):
+    content = "\0".join(map(str, (kind, *parts)))
+    return sha256(content.encode()).hexdigest()
+
+
+def conditional_response(etag, build_body):
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify(build_body())
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+def get_per_page():
+    per_page = request.args.get("per_page", PER_PAGE, type=int)
+    return min(max(per_page, 1), MAX_PER_PAGE)
+
+
+def list_response(kind, versions, load_items, schema):
+    etag = make_etag(
+        kind,
+        versions.has_prev,
+        versions.has_next,
+        *(f"{item.id}:{item.version}" for item in versions.items),
+    )
+
+    def build_body():
+        ids = [item.id for item in versions.items]
+        by_id = {item.id: item for item in load_items(ids)} if ids else {}
+        return {
+            "items": schema.dump([by_id[id] for id in ids if id in by_id], many=True),
+            "has_prev": versions.has_prev,
+            "has_next": versions.has_next,
+            "prev_cursor": versions.prev_cursor,
+            "next_cursor": versions.next_cursor,
+        }
+
+    return conditional_response(etag, build_body)
+
+
+def item_response(kind, model, item_id, load_item, schema):
+    version = model.query.with_entities(model.version).filter_by(id=item_id).scalar()
+    if version is None:
+        abort(404)
+    etag = make_etag(kind, item_id, version)
+    return conditional_response(etag, lambda: schema.dump(load_item(item_id)))
+
+
+@api.route("/machines")
+@auth.login_required
+def list_machines():
+    filters = {
+        k: v
+        for k, v in request.args.items()
+        if k in ("name", "place", "status", "hardware", "platform") and v
+    }
+    try:
+        query = filter_machines(
+            Machine.query.with_entities(Machine.id, Machine.version), **filters
+        )
+        versions = paginate_keyset(
+            query,
+            SORT_COLUMNS[request.args.get("sort", "name")],
+            Machine.id,
+            descending=request.args.get("order", "asc") == "desc",
+            after=request.args.get("after", type=int),
+            before=request.args.get("before", type=int),
+            per_page=get_per_page(),
+        )
+    except KeyError:
+        return jsonify(error="Incorrect machine status or sort order"), 400
+
+    return list_response(
+        "machines",
+        versions,
+        lambda ids: Machine.query_with_providers().filter(Machine.id.in_(ids)),
+        machine_api_schema,
+    )
+
+
+@api.route("/machines/<int:machine_id>")
+@auth.login_required
+def get_machine(machine_id):
+    return item_response(
+        "machine",
+        Machine,
+        machine_id,
+        lambda id: Machine.query_with_providers().filter_by(id=id).one(),
+        machine_api_schema,
+    )
+
+
+def query_credential_metadata():
+    return Credential.query.with_entities(
+        Credential.id,
+        Credential.version,
+        Credential.name,
+        Credential.type,
+        Credential.__table__.c.key_type,
+    )
+
+
+@api.route("/credentials")
+@auth.login_required
+def list_credentials():
+    versions = paginate_keyset(
+        Credential.query.with_entities(Credential.id, Credential.version),
+        Credential.id,
+        Credential.id,
+        after=request.args.get("after", type=int),
+        before=request.args.get("before", type=int),
+        per_page=get_per_page(),
+    )
+    return list_response(
+        "credentials",
+        versions,
+        lambda ids: query_credential_metadata().filter(Credential.id.in_(ids)),
+        credential_metadata_schema,
+    )
+
+
+@api.route("/credentials/<int:credential_id>")
+@auth.login_required
+def get_credential(credential_id):
+    return item_response(
+        "credential",
+        Credential,
+        credential_id,
+        lambda id: query_credential_metadata().filter(Credential.id == id).one(),
+        credential_metadata_schema,
+    )
+
+
+@api.route("/custom_operations")
+@auth.login_required
+def list_custom_operations():
+    versions = paginate_keyset(
+        CustomOperation.query.with_entities(
+            CustomOperation.id, CustomOperation.version
+        ),
+        CustomOperation.id,
+        CustomOperation.id,
+        after=request.args.get("after", type=int),
+        before=request.args.get("before", type=int),
+        per_page=get_per_page(),
+    )
+    return list_response(
+        "custom_operations",
+        versions,
+        lambda ids: CustomOperation.query.filter(CustomOperation.id.in_(ids)),
+        custom_op_api_schema,
+    )
+
+
+@api.route("/custom_operations/<int:custom_op_id>")
+@auth.login_required
+def get_custom_operation(custom_op_id):
+    return item_response(
+        "custom_operation",
+        CustomOperation,
+        custom_op_id,
+        lambda id: CustomOperation.query.get(id),
+        custom_op_api_schema,
+    )
@@ -1,9 +1,11 @@
+import click
 from flask import render_template, Blueprint, request
 from flask_marshmallow import Marshmallow
 from marshmallow import fields, post_load, ValidationError, EXCLUDE
 from marshmallow.validate import Length, OneOf
 from marshmallow_oneofschema import OneOfSchema
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import undefer
 
 from app import db, auth
 from model.credential import (
@@ -12,7 +14,9 @@ from model.credential import (
     SshKeyNoPassword,
     SshKeyWithPassword,
     SshCredential,
+    reencrypt_batch,
 )
+from utils.ssh_pool import ssh_pool
 
 credentials = Blueprint("credentials", __name__, template_folder="templates")
 
@@ -75,7 +79,7 @@ credential_schema = CredentialSchema()
 def all_credentials():
     return render_template(
         "credentials.html",
-        credentials=Credential.query.paginate(),
+        credentials=Credential.query.options(undefer(Credential.username)).paginate(),
         types=CREDENTIAL_TYPES,
     )
 
@@ -105,6 +109,8 @@ def delete_credential(credential_id):
     credential = Credential.query.get_or_404(credential_id)
     db.session.delete(credential)
     db.session.commit()
+    SshCredential.invalidate_cached_pkey(credential.id)
+    ssh_pool.close(lambda key: key[1] == credential.id)
     message = f"Successfully deleted '{credential.name}' credential."
     return render_template("success.html", message=message, redirect="/credentials")
 
@@ -172,6 +178,8 @@ def update_credential(credential_id):
 
         db.session.merge(updated)
         db.session.commit()
+        SshCredential.invalidate_cached_pkey(updated.id)
+        ssh_pool.close(lambda key: key[1] == updated.id)
         message = f"Successfully updated '{updated.name}' credential."
         return render_template("success.html", message=message, redirect="/credentials")
     except ValidationError as e:
@@ -190,3 +198,19 @@ def update_credential(credential_id):
             render_template("edit_credential.html", credential=previous, errors=errors),
             200,
         )
+
+
+@credentials.cli.command("reencrypt")
+@click.option("--batch-size", type=int, default=100, show_default=True)
+@click.option(
+    "--start-after", type=int, default=0, help="Resume after this credential ID."
+)
+def reencrypt_command(batch_size, start_after):
+    last_id, total = start_after, 0
+    while True:
+        last_id, updated = reencrypt_batch(last_id, batch_size)
+        if last_id is None:
+            break
+        total += updated
+        click.echo(f"Re-encrypted {total} credentials, last ID {last_id}")
+    click.echo(f"Done, re-encrypted {total} credentials")
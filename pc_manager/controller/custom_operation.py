@@ -1,3 +1,4 @@
+import click
 from flask import render_template, Blueprint, request, session, redirect
 from flask_marshmallow import Marshmallow
 from marshmallow import fields, post_load, ValidationError, EXCLUDE
@@ -6,7 +7,11 @@ from sqlalchemy.exc import IntegrityError
 
 from app import db, auth
 from model.base import BASIC_OPS
-from model.custom_operation import CustomOperation
+from model.custom_operation import (
+    CustomOperation,
+    compile_plans,
+    recompile_plans,
+)
 
 custom_operations = Blueprint(
     "custom_operations", __name__, template_folder="templates"
@@ -23,6 +28,7 @@ ma = Marshmallow()
 class OperationSchema(ma.Schema):
     op_name = fields.Str(required=True)
     argument = fields.Str(allow_none=True, validate=Length(max=127))
+    group = fields.Str(allow_none=True, validate=Length(max=31))
 
 
 class CustomOperationSchema(ma.Schema):
@@ -60,7 +66,10 @@ def add_custom_operation():
     custom_op = session["steps"]
     return (
         render_template(
-            "add_custom_operation.html", custom_op=custom_op, basic_ops=BASIC_OPS
+            "add_custom_operation.html",
+            custom_op=custom_op,
+            basic_ops=BASIC_OPS,
+            custom_ops=CustomOperation.query.all(),
         ),
         200,
     )
@@ -88,6 +97,7 @@ def edit_custom_operation(custom_operation_id):
             description=custom_operation.description,
             custom_op=custom_op,
             basic_ops=BASIC_OPS,
+            custom_ops=CustomOperation.query.all(),
         ),
         200,
     )
@@ -100,6 +110,15 @@ def edit_custom_operation(custom_operation_id):
 def delete_custom_operation(custom_operation_id):
     custom_operation = CustomOperation.query.get_or_404(custom_operation_id)
     db.session.delete(custom_operation)
+    try:
+        recompile_plans(CustomOperation.query.all())
+    except ValueError as e:
+        db.session.rollback()
+        return render_template(
+            "error.html",
+            message=f"Cannot delete '{custom_operation.name}': {e}",
+            redirect="/custom_operations",
+        )
     db.session.commit()
     message = f"Successfully deleted '{custom_operation.name}' custom operation."
     return render_template(
@@ -122,6 +141,7 @@ def add_operation_step():
         new_step = operation_schema.load(request.form, unknown=EXCLUDE)
         if new_step["op_name"] not in (op.name for op in BASIC_OPS if op.with_argument):
             new_step["argument"] = None
+        new_step["group"] = new_step.get("group") or None
 
         custom_op.append(new_step)
         session["steps"] = custom_op
@@ -135,6 +155,7 @@ def add_operation_step():
                 redirects[1],
                 custom_op=custom_op,
                 basic_ops=BASIC_OPS,
+                custom_ops=CustomOperation.query.all(),
                 errors=errors,
             ),
             200,
@@ -173,6 +194,7 @@ def create_custom_operation():
     try:
         new_custom_op = custom_op_schema.load(new_custom_op, unknown=EXCLUDE)
         db.session.add(new_custom_op)
+        recompile_plans(CustomOperation.query.all(), new_custom_op)
         db.session.commit()
 
         session.clear()
@@ -190,6 +212,20 @@ def create_custom_operation():
                 "add_custom_operation.html",
                 custom_op=custom_op,
                 basic_ops=BASIC_OPS,
+                custom_ops=CustomOperation.query.all(),
+                errors=errors,
+            ),
+            200,
+        )
+    except ValueError as e:
+        db.session.rollback()
+        errors = [f"Field 'ops': {e}"]
+        return (
+            render_template(
+                "add_custom_operation.html",
+                custom_op=custom_op,
+                basic_ops=BASIC_OPS,
+                custom_ops=CustomOperation.query.all(),
                 errors=errors,
             ),
             200,
@@ -202,6 +238,7 @@ def create_custom_operation():
                 "add_custom_operation.html",
                 custom_op=custom_op,
                 basic_ops=BASIC_OPS,
+                custom_ops=CustomOperation.query.all(),
                 errors=errors,
             ),
             200,
@@ -222,7 +259,8 @@ def update_custom_operation(custom_operations_id):
     try:
         updated = custom_op_schema.load(form, unknown=EXCLUDE)
         updated.id = int(custom_operations_id)
-        db.session.merge(updated)
+        updated = db.session.merge(updated)
+        recompile_plans(CustomOperation.query.all(), updated)
         db.session.commit()
 
         session.clear()
@@ -242,6 +280,22 @@ def update_custom_operation(custom_operations_id):
                 description=form["description"],
                 custom_op=custom_op,
                 basic_ops=BASIC_OPS,
+                custom_ops=CustomOperation.query.all(),
+                errors=errors,
+            ),
+            200,
+        )
+    except ValueError as e:
+        db.session.rollback()
+        errors = [f"Field 'ops': {e}"]
+        return (
+            render_template(
+                "edit_custom_operation.html",
+                name=form["name"],
+                description=form["description"],
+                custom_op=custom_op,
+                basic_ops=BASIC_OPS,
+                custom_ops=CustomOperation.query.all(),
                 errors=errors,
             ),
             200,
@@ -256,7 +310,20 @@ def update_custom_operation(custom_operations_id):
                 description=form["description"],
                 custom_op=custom_op,
                 basic_ops=BASIC_OPS,
+                custom_ops=CustomOperation.query.all(),
                 errors=errors,
             ),
             200,
         )
+
+
+@custom_operations.cli.command("compile-plans")
+def compile_plans_command():
+    custom_ops = CustomOperation.query.order_by(CustomOperation.id).all()
+    errors = compile_plans(custom_ops)
+    db.session.commit()
+    for custom_op, error in errors.items():
+        click.echo(f"Custom operation {custom_op.id} '{custom_op.name}': {error}")
+    click.echo(f"Compiled {len(custom_ops) - len(errors)} custom operations")
+    if errors:
+        raise click.ClickException(f"{len(errors)} custom operations failed to compile")
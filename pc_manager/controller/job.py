@@ -0,0 +1,35 @@
+from flask import render_template, Blueprint, jsonify
+
+from app import auth
+from model.job import Job
+
+jobs = Blueprint("jobs", __name__, template_folder="templates")
+
+
+@jobs.route("/jobs/<job_id>", methods=["GET"])
+@auth.login_required
+def job_details(job_id):
+    job = Job.query.get_or_404(job_id)
+    return render_template("job.html", job=job)
+
+
+@jobs.route("/jobs/<job_id>/status", methods=["GET"])
+@auth.login_required
+def job_status(job_id):
+    job = Job.query.get_or_404(job_id)
+    return jsonify(
+        id=job.id,
+        machine_id=job.machine_id,
+        description=job.description,
+        status=job.status.value,
+        current_step=job.current_step,
+        steps=[
+            {"step": step, "state": state, "result": result}
+            for step, state, result in job.get_step_states()
+        ],
+        results=job.results,
+        error=job.error,
+        created_time=job.created_time.isoformat(),
+        started_time=job.started_time and job.started_time.isoformat(),
+        finished_time=job.finished_time and job.finished_time.isoformat(),
+    )
@@ -1,21 +1,45 @@
 from datetime import datetime
 from functools import partial
 
+import click
 from flask import render_template, Blueprint, request, session, redirect
 from flask_marshmallow import Marshmallow
-from marshmallow import fields, post_load, ValidationError, EXCLUDE
-from marshmallow.validate import Length, Regexp
+from marshmallow import fields, post_load, pre_load, ValidationError, EXCLUDE
+from marshmallow.validate import Length, OneOf, Regexp
 from marshmallow_oneofschema import OneOfSchema
 from sqlalchemy.exc import IntegrityError
 
 from app import db, auth
-from model.base import MachineStatus
-from model.credential import Credential
+from model.base import MachineStatus, StatusProbe
 from model.custom_operation import CustomOperation
-from model.hardware_features import WakeOnLan, LibvirtGuest
-from model.machine import Machine
-from model.software_platform import LinuxPlatform, WindowsPlatform
-from utils import execute_operations, display_duration
+from model.hardware_features import HardwareFeatures, WakeOnLan, LibvirtGuest
+from model.job import Job
+from model.machine import Machine, SORT_COLUMNS
+from model.reference_data import get_reference_data
+from model.software_platform import (
+    FreeBsdPlatform,
+    LinuxPlatform,
+    SoftwarePlatform,
+    SshAccessiblePlatform,
+    WindowsPlatform,
+)
+from utils import display_duration
+from utils.bulk_action import (
+    execute_steps,
+    run_bulk_action,
+    HOST_CONCURRENCY,
+    MAX_WORKERS as BULK_WORKERS,
+)
+from utils.bulk_wake import wake_machines
+from utils.job_queue import job_queue
+from utils.pagination import paginate_keyset, PER_PAGE, MAX_PER_PAGE
+from utils.status_refresh import (
+    refresh_machine_statuses,
+    refresh_statuses,
+    select_machine_ids,
+    HOST_TIMEOUT,
+    MAX_WORKERS,
+)
 
 machines = Blueprint("machines", __name__, template_folder="templates")
 
@@ -25,6 +49,9 @@ REDIRECTS = {
     "EXECUTE": lambda id: (f"/execute_action/{id}", "execute_action.html"),
 }
 
+HARDWARE_TYPES = [WakeOnLan, LibvirtGuest]
+PLATFORM_TYPES = [LinuxPlatform, FreeBsdPlatform, WindowsPlatform]
+
 ma = Marshmallow()
 
 
@@ -33,6 +60,15 @@ class WakeOnLanSchema(ma.Schema):
     mac_address = fields.Str(
         required=True, validate=Regexp(r"^([0-9A-Fa-f]{2}[:-]){5}([0-9A-Fa-f]{2})$")
     )
+    broadcast_address = fields.Str(
+        allow_none=True, validate=Regexp(r"^(\d{1,3}\.){3}\d{1,3}$")
+    )
+
+    @pre_load
+    def drop_empty_broadcast_address(self, data, **_):
+        if data.get("broadcast_address"):
+            return data
+        return {k: v for k, v in data.items() if k != "broadcast_address"}
 
     @post_load
     def make_wakeonlan(self, data, **_):
@@ -61,16 +97,35 @@ class LinuxPlatformSchema(ma.Schema):
     id = fields.Integer(allow_none=True)
     hostname = fields.Str(required=True)
     credential_id = fields.Integer(required=True)
+    status_probe = fields.Str(
+        allow_none=True, validate=OneOf([p.value for p in StatusProbe])
+    )
 
     @post_load
     def make_linux_platform(self, data, **_):
         return LinuxPlatform(**data)
 
 
+class FreeBsdPlatformSchema(ma.Schema):
+    id = fields.Integer(allow_none=True)
+    hostname = fields.Str(required=True)
+    credential_id = fields.Integer(required=True)
+    status_probe = fields.Str(
+        allow_none=True, validate=OneOf([p.value for p in StatusProbe])
+    )
+
+    @post_load
+    def make_freebsd_platform(self, data, **_):
+        return FreeBsdPlatform(**data)
+
+
 class WindowsPlatformSchema(ma.Schema):
     id = fields.Integer(allow_none=True)
     hostname = fields.Str(required=True)
     credential_id = fields.Integer(required=True)
+    status_probe = fields.Str(
+        allow_none=True, validate=OneOf([p.value for p in StatusProbe])
+    )
 
     @post_load
     def make_windows_platform(self, data, **_):
@@ -80,6 +135,7 @@ class WindowsPlatformSchema(ma.Schema):
 class SoftwarePlatformSchema(OneOfSchema):
     subtypes = {
         LinuxPlatform: LinuxPlatformSchema,
+        FreeBsdPlatform: FreeBsdPlatformSchema,
         WindowsPlatform: WindowsPlatformSchema,
     }
     type_schemas = {k.PROVIDER_NAME: v for k, v in subtypes.items()}
@@ -111,13 +167,66 @@ machine_schema = MachineSchema()
 @machines.route("/")
 @auth.login_required
 def all_machines():
+    filters = {
+        k: v
+        for k, v in request.args.items()
+        if k in ("name", "place", "status", "hardware", "platform") and v
+    }
+    sort = request.args.get("sort", "name")
+    order = request.args.get("order", "asc")
+    per_page = request.args.get("per_page", PER_PAGE, type=int)
+    per_page = min(max(per_page, 1), MAX_PER_PAGE)
+    try:
+        query = filter_machines(Machine.query_with_providers(), **filters)
+        page = paginate_keyset(
+            query,
+            SORT_COLUMNS[sort],
+            Machine.id,
+            descending=order == "desc",
+            after=request.args.get("after", type=int),
+            before=request.args.get("before", type=int),
+            per_page=per_page,
+        )
+    except KeyError:
+        message = "Incorrect machine status or sort order"
+        return render_template("error.html", message=message, redirect="/")
+
     return render_template(
         "machines.html",
-        machines=Machine.query.paginate(),
+        machines=page,
+        filters=filters,
+        sort=sort,
+        order=order,
+        per_page=per_page,
+        statuses=list(MachineStatus),
+        hardware_types=HARDWARE_TYPES,
+        platform_types=PLATFORM_TYPES,
         display_duration=partial(display_duration, datetime.now()),
     )
 
 
+def filter_machines(
+    query, name=None, place=None, status=None, hardware=None, platform=None
+):
+    if name:
+        query = query.filter(Machine.name.ilike(f"%{name}%"))
+    if place:
+        query = query.filter(Machine.place == place)
+    if status:
+        query = query.filter(Machine.last_status == MachineStatus[status])
+    if hardware == "none":
+        query = query.filter(~Machine.hardware_features.has())
+    elif hardware:
+        query = query.filter(
+            Machine.hardware_features.has(HardwareFeatures.type == hardware)
+        )
+    if platform:
+        query = query.filter(
+            Machine.software_platforms.any(SoftwarePlatform.type == platform)
+        )
+    return query
+
+
 @machines.route("/add_machine", methods=["GET"])
 @auth.login_required
 def add_machine():
@@ -136,9 +245,9 @@ def add_machine():
         render_template(
             "add_machine.html",
             machine=machine,
-            custom_ops=CustomOperation.query.all(),
-            linux_hosts=LinuxPlatform.query.all(),
-            credentials=Credential.query,
+            reference_data=get_reference_data(),
+            status_probes=StatusProbe,
+            default_status_probe=SshAccessiblePlatform.STATUS_PROBE,
         ),
         200,
     )
@@ -147,7 +256,7 @@ def add_machine():
 @machines.route("/edit_machine/<machine_id>", methods=["GET"])
 @auth.login_required
 def edit_machine(machine_id):
-    machine = Machine.query.get_or_404(machine_id)
+    machine = Machine.query_with_providers().get_or_404(machine_id)
     if ("action" not in session) or (session["action"] != "MACHINE_EDIT"):
         session.clear()
         session["action"] = "MACHINE_EDIT"
@@ -171,9 +280,9 @@ def edit_machine(machine_id):
             name=machine.name,
             place=machine.place,
             providers=providers,
-            custom_ops=CustomOperation.query.all(),
-            linux_hosts=LinuxPlatform.query.all(),
-            credentials=Credential.query,
+            reference_data=get_reference_data(),
+            status_probes=StatusProbe,
+            default_status_probe=SshAccessiblePlatform.STATUS_PROBE,
         ),
         200,
     )
@@ -192,7 +301,7 @@ def delete_machine(machine_id):
 @machines.route("/execute_action/<machine_id>", methods=["GET"])
 @auth.login_required
 def define_action(machine_id):
-    machine = Machine.query.get_or_404(machine_id)
+    machine = Machine.query_with_providers().get_or_404(machine_id)
     if ("action" not in session) or (session["action"] != "MACHINE_EXECUTE"):
         session.clear()
         session["action"] = "MACHINE_EXECUTE"
@@ -202,9 +311,7 @@ def define_action(machine_id):
         session["steps"] = []
         session["redirect"] = REDIRECTS["EXECUTE"](machine_id)
 
-    available_ops = {}
-    for provider in reversed(machine.get_operation_providers()):
-        available_ops |= provider.get_operations()
+    available_ops = machine.get_available_operations()
     return (
         render_template(
             "execute_action.html",
@@ -222,20 +329,13 @@ def execute_action(machine_id):
         return redirect(f"/execute_action/{machine_id}")
 
     machine = Machine.query.get_or_404(machine_id)
-    steps = session["steps"]
-    try:
-        execute_operations(machine, steps)
-    except Exception as e:
-        message = f"Could not execute action for machine '{machine.name}'"
-        return render_template("error.html", message=message, redirect="/")
-
-    machine.last_status = machine.get_status()
-    machine.last_status_time = datetime.now()
+    job = Job(machine, f"Execute action for '{machine.name}'", steps=session["steps"])
+    db.session.add(job)
     db.session.commit()
+    job_queue.submit(job.id)
 
     session.clear()
-    message = f"Successfully executed action for '{machine.name}'"
-    return render_template("success.html", message=message, redirect="/")
+    return redirect(f"/jobs/{job.id}")
 
 
 @machines.route("/clear_action")
@@ -249,22 +349,235 @@ def clear_action():
 @auth.login_required
 def change_status(machine_id):
     machine = Machine.query.get_or_404(machine_id)
+    try:
+        target_status = MachineStatus[request.args.get("target_status")]
+    except KeyError:
+        message = "Incorrect machine status"
+        return render_template("error.html", message=message, redirect="/")
 
-    target_status = MachineStatus[request.args.get("target_status")]
-    new_status = machine.ensure_status(target_status)
-
-    machine.last_status = new_status
-    machine.last_status_time = datetime.now()
+    description = f"Set status of '{machine.name}' to {target_status.value}"
+    job = Job(machine, description, target_status=target_status)
+    db.session.add(job)
     db.session.commit()
+    job_queue.submit(job.id)
+
+    return redirect(f"/jobs/{job.id}")
 
-    if new_status != target_status:
-        message = f"Could not set status for machine '{machine.name}'"
+
+def select_form_machine_ids():
+    filters = {
+        k: v
+        for k, v in request.form.items()
+        if k in ("name", "place", "status", "hardware", "platform") and v
+    }
+    query = filter_machines(Machine.query.with_entities(Machine.id), **filters)
+    if ids := request.form.getlist("id", type=int):
+        query = query.filter(Machine.id.in_(ids))
+    return [id for (id,) in query.order_by(Machine.id)]
+
+
+@machines.route("/refresh_status", methods=["POST"])
+@auth.login_required
+def refresh_status():
+    try:
+        machine_ids = select_form_machine_ids()
+    except KeyError:
+        message = "Incorrect machine status"
         return render_template("error.html", message=message, redirect="/")
 
-    message = f"Successfully set machine '{machine.name}' status to {new_status.value}"
+    if machine_ids:
+        job_queue.submit_task(refresh_machine_statuses, machine_ids)
+    message = f"Refreshing status of {len(machine_ids)} machines in the background"
     return render_template("success.html", message=message, redirect="/")
 
 
+@machines.route("/wake_machines", methods=["POST"])
+@auth.login_required
+def wake_machines_action():
+    try:
+        machine_ids = select_form_machine_ids()
+    except KeyError:
+        message = "Incorrect machine status"
+        return render_template("error.html", message=message, redirect="/")
+
+    repeat = request.form.get("repeat", WakeOnLan.REPEAT_COUNT, type=int)
+    if not 1 <= repeat <= WakeOnLan.MAX_REPEAT_COUNT:
+        message = f"Repeat count must be between 1 and {WakeOnLan.MAX_REPEAT_COUNT}"
+        return render_template("error.html", message=message, redirect="/")
+
+    woken_ids, statuses = wake_machines(machine_ids, repeat)
+
+    names = dict(
+        Machine.query.with_entities(Machine.id, Machine.name).filter(
+            Machine.id.in_(machine_ids)
+        )
+    )
+    results = []
+    for id in machine_ids:
+        if id not in woken_ids:
+            result = "no Wake-on-LAN"
+        elif id in statuses:
+            result = statuses[id].value
+        else:
+            result = "timed out"
+        results.append((names[id], result))
+    return render_template(
+        "machine_report.html",
+        message=f"Sent Wake-on-LAN packets to {len(woken_ids)} machines",
+        results=results,
+        redirect="/",
+    )
+
+
+@machines.route("/bulk_action", methods=["GET"])
+@auth.login_required
+def define_bulk_action():
+    custom_operation = CustomOperation.query.get_or_404(
+        request.args.get("operation_id")
+    )
+    return render_template(
+        "bulk_action.html",
+        custom_operation=custom_operation,
+        machines=Machine.query.with_entities(Machine.id, Machine.name, Machine.place)
+        .order_by(Machine.name)
+        .all(),
+        max_workers=BULK_WORKERS,
+        host_concurrency=HOST_CONCURRENCY,
+    )
+
+
+@machines.route("/bulk_action", methods=["POST"])
+@auth.login_required
+def execute_bulk_action():
+    custom_operation = CustomOperation.query.get_or_404(
+        request.form.get("operation_id")
+    )
+    machine_ids = request.form.getlist("machine_id", type=int)
+    max_workers = request.form.get("parallelism", BULK_WORKERS, type=int)
+    host_concurrency = request.form.get("host_concurrency", HOST_CONCURRENCY, type=int)
+    if not 1 <= max_workers <= BULK_WORKERS or host_concurrency < 1:
+        message = (
+            f"Parallelism must be between 1 and {BULK_WORKERS} "
+            "and host concurrency at least 1"
+        )
+        redirect_url = f"/bulk_action?operation_id={custom_operation.id}"
+        return render_template("error.html", message=message, redirect=redirect_url)
+
+    machines = Machine.query.filter(Machine.id.in_(machine_ids)).order_by(Machine.name)
+    jobs = [
+        Job(
+            machine,
+            f"Run '{custom_operation.name}' on '{machine.name}'",
+            steps=custom_operation.get_plan(),
+        )
+        for machine in machines
+    ]
+    db.session.add_all(jobs)
+    db.session.commit()
+    job_queue.submit_bulk(
+        {job.machine_id: job.id for job in jobs},
+        max_workers=max_workers,
+        host_concurrency=host_concurrency,
+        fail_fast="fail_fast" in request.form,
+    )
+
+    return render_template(
+        "machine_report.html",
+        message=f"Queued '{custom_operation.name}' on {len(jobs)} machines",
+        results=[(job.machine.name, job) for job in jobs],
+        redirect="/custom_operations",
+    )
+
+
+@machines.cli.command("run-action")
+@click.option("--operation", help="Name of the custom operation to run.")
+@click.option(
+    "--step",
+    "steps",
+    multiple=True,
+    help="Ad-hoc step as OP_NAME or OP_NAME:ARGUMENT, used without --operation.",
+)
+@click.option("--id", "ids", type=int, multiple=True, help="Target machine ID.")
+@click.option("--place", help="Only target machines in this place.")
+@click.option(
+    "--status",
+    type=click.Choice([s.name for s in MachineStatus]),
+    help="Only target machines with this last status.",
+)
+@click.option(
+    "--workers",
+    type=click.IntRange(min=1, max=BULK_WORKERS),
+    default=BULK_WORKERS,
+    show_default=True,
+)
+@click.option(
+    "--host-concurrency",
+    type=click.IntRange(min=1),
+    default=HOST_CONCURRENCY,
+    show_default=True,
+)
+@click.option("--fail-fast", is_flag=True, help="Skip remaining machines on error.")
+def run_action_command(
+    operation, steps, ids, place, status, workers, host_concurrency, fail_fast
+):
+    if operation:
+        custom_operation = CustomOperation.query.filter_by(name=operation).first()
+        if custom_operation is None:
+            raise click.BadParameter(f"no custom operation named '{operation}'")
+        steps = custom_operation.get_plan()
+    elif steps:
+        steps = [
+            dict(zip(("op_name", "argument"), step.split(":", 1))) for step in steps
+        ]
+    else:
+        raise click.UsageError("either --operation or --step is required")
+
+    machine_ids = select_machine_ids(
+        ids, place, MachineStatus[status] if status else None
+    )
+    results = run_bulk_action(
+        machine_ids,
+        partial(execute_steps, steps),
+        max_workers=workers,
+        host_concurrency=host_concurrency,
+        fail_fast=fail_fast,
+    )
+    for machine_id in machine_ids:
+        click.echo(f"{machine_id}\t{results[machine_id]}")
+    if any(result != "success" for result in results.values()):
+        raise SystemExit(1)
+
+
+@machines.cli.command("refresh-status")
+@click.option("--id", "ids", type=int, multiple=True, help="Machine ID to refresh.")
+@click.option("--place", help="Only refresh machines in this place.")
+@click.option(
+    "--status",
+    type=click.Choice([s.name for s in MachineStatus]),
+    help="Only refresh machines with this last status.",
+)
+@click.option(
+    "--workers", type=click.IntRange(min=1), default=MAX_WORKERS, show_default=True
+)
+@click.option(
+    "--timeout",
+    type=click.FloatRange(min=0, min_open=True),
+    default=HOST_TIMEOUT,
+    show_default=True,
+)
+def refresh_status_command(ids, place, status, workers, timeout):
+    machine_ids, statuses = refresh_statuses(
+        ids=ids,
+        place=place,
+        status=MachineStatus[status] if status else None,
+        max_workers=workers,
+        host_timeout=timeout,
+    )
+    for machine_id in machine_ids:
+        status = statuses.get(machine_id)
+        click.echo(f"{machine_id}\t{status.value if status else 'timed out'}")
+
+
 @machines.route("/add_hardware_features", methods=["POST"])
 @auth.login_required
 def add_hardware_features():
@@ -286,9 +599,9 @@ def add_hardware_features():
             render_template(
                 redirects[1],
                 machine=machine,
-                custom_ops=CustomOperation.query.all(),
-                linux_hosts=LinuxPlatform.query.all(),
-                credentials=Credential.query,
+                reference_data=get_reference_data(),
+                status_probes=StatusProbe,
+                default_status_probe=SshAccessiblePlatform.STATUS_PROBE,
                 errors=errors,
             ),
             200,
@@ -331,9 +644,9 @@ def add_software_platform():
             render_template(
                 redirects[1],
                 machine=machine,
-                custom_ops=CustomOperation.query.all(),
-                linux_hosts=LinuxPlatform.query.all(),
-                credentials=Credential.query,
+                reference_data=get_reference_data(),
+                status_probes=StatusProbe,
+                default_status_probe=SshAccessiblePlatform.STATUS_PROBE,
                 errors=errors,
             ),
             200,
@@ -398,9 +711,9 @@ def create_machine():
             render_template(
                 "add_machine.html",
                 machine=machine,
-                custom_ops=CustomOperation.query.all(),
-                linux_hosts=LinuxPlatform.query.all(),
-                credentials=Credential.query,
+                reference_data=get_reference_data(),
+                status_probes=StatusProbe,
+                default_status_probe=SshAccessiblePlatform.STATUS_PROBE,
                 errors=errors,
             ),
             200,
@@ -412,9 +725,9 @@ def create_machine():
             render_template(
                 "add_machine.html",
                 machine=machine,
-                custom_ops=CustomOperation.query.all(),
-                linux_hosts=LinuxPlatform.query.all(),
-                credentials=Credential.query,
+                reference_data=get_reference_data(),
+                status_probes=StatusProbe,
+                default_status_probe=SshAccessiblePlatform.STATUS_PROBE,
                 errors=errors,
             ),
             200,
@@ -441,9 +754,9 @@ def update_machine(machine_id):
                 name=form["name"],
                 place=form["place"],
                 providers=providers,
-                custom_ops=CustomOperation.query.all(),
-                linux_hosts=LinuxPlatform.query.all(),
-                credentials=Credential.query,
+                reference_data=get_reference_data(),
+                status_probes=StatusProbe,
+                default_status_probe=SshAccessiblePlatform.STATUS_PROBE,
                 errors=errors,
             ),
             200,
@@ -475,9 +788,9 @@ def update_machine(machine_id):
                     name=form["name"],
                     place=form["place"],
                     providers=providers,
-                    custom_ops=CustomOperation.query.all(),
-                    linux_hosts=LinuxPlatform.query.all(),
-                    credentials=Credential.query,
+                    reference_data=get_reference_data(),
+                    status_probes=StatusProbe,
+                    default_status_probe=SshAccessiblePlatform.STATUS_PROBE,
                     errors=errors,
                 ),
                 200,
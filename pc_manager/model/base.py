@@ -1,5 +1,8 @@
 from collections import namedtuple
 from enum import Enum
+from functools import wraps
+
+from utils.cache import TtlCache
 
 BasicOp = namedtuple("BasicOp", ["name", "description", "with_argument"])
 
@@ -35,13 +38,65 @@ class MachineStatus(Enum):
     SUSPENDED = "suspended"
 
 
+class StatusProbe(Enum):
+    TCP = "tcp"
+    BANNER = "banner"
+    AUTH = "auth"
+
+
 class OperationProvider:
     def get_operations(self):
         raise NotImplementedError()
 
 
+STATUS_CACHE = TtlCache(ttl=3)
+
+
+def cached_status(get_status):
+    @wraps(get_status)
+    def wrapper(self, use_cache=True):
+        if use_cache and (status := self.get_cached_status()) is not None:
+            return status
+
+        status = get_status(self)
+        self.cache_status(status)
+        return status
+
+    return wrapper
+
+
+def invalidates_status(operation):
+    @wraps(operation)
+    def wrapper(self, *args):
+        try:
+            return operation(self, *args)
+        finally:
+            self.invalidate_status()
+
+    return wrapper
+
+
 class StatusManager:
-    def get_status(self):
+    def get_status_cache_key(self):
+        if self.id is None:
+            return None
+        return self.machine_id, self.__tablename__, self.id
+
+    def invalidate_status(self):
+        STATUS_CACHE.invalidate(lambda key: key[0] == self.machine_id)
+
+    def get_cached_status(self):
+        key = self.get_status_cache_key()
+        return STATUS_CACHE.get(key) if key is not None else None
+
+    def cache_status(self, status):
+        if (key := self.get_status_cache_key()) is not None:
+            STATUS_CACHE.put(key, status)
+
+    def get_status_check(self):
+        raise NotImplementedError()
+
+    def get_status(self, use_cache=True):
         raise NotImplementedError()
 
     def ensure_status(self, target_status):
@@ -1,18 +1,27 @@
+from hashlib import sha256
 from io import StringIO
 
-from paramiko.dsskey import DSSKey
-from paramiko.ecdsakey import ECDSAKey
-from paramiko.ed25519key import Ed25519Key
-from paramiko.rsakey import RSAKey
-from sqlalchemy_utils.types.encrypted.encrypted_type import (
-    AesEngine,
-    StringEncryptedType,
+from sqlalchemy import literal, select, type_coerce, update
+from sqlalchemy_utils.types.encrypted.encrypted_type import StringEncryptedType
+
+from app import db, ENCRYPTION_KEYS, ENCRYPTION_KEY_ID, SECRET_KEY
+from model.version import Versioned
+from utils import lazy_import
+from utils.cache import TtlCache
+from utils.encryption import Keyring, KeyringEngine
+
+paramiko = lazy_import("paramiko")
+
+KEYRING = Keyring(
+    Keyring.parse_keys(ENCRYPTION_KEYS), ENCRYPTION_KEY_ID, legacy_key=SECRET_KEY
 )
 
-from app import db, SECRET_KEY
+
+class CredentialEngine(KeyringEngine):
+    keyring = KEYRING
 
 
-class Credential(db.Model):
+class Credential(db.Model, Versioned):
     __tablename__ = "credential"
     __mapper_args__ = {"polymorphic_on": "type"}
 
@@ -20,14 +29,29 @@ class Credential(db.Model):
     name = db.Column(db.String(127), unique=True)
     type = db.Column(db.String(31))
 
-    username = db.Column(StringEncryptedType(db.String, SECRET_KEY, AesEngine, "pkcs5"))
-    secret = db.Column(StringEncryptedType(db.String, SECRET_KEY, AesEngine, "pkcs5"))
+    username = db.deferred(
+        db.Column(StringEncryptedType(db.String, SECRET_KEY, CredentialEngine))
+    )
+    secret = db.deferred(
+        db.Column(StringEncryptedType(db.String, SECRET_KEY, CredentialEngine)),
+        group="secrets",
+    )
 
 
 class SshCredential(Credential):
-    KEY_TYPES = {"ed25519": Ed25519Key, "ecdsa": ECDSAKey, "dss": DSSKey, "rsa": RSAKey}
-
-    key = db.Column(StringEncryptedType(db.String, SECRET_KEY, AesEngine, "pkcs5"))
+    KEY_TYPES = {
+        "ed25519": "Ed25519Key",
+        "ecdsa": "ECDSAKey",
+        "dss": "DSSKey",
+        "rsa": "RSAKey",
+    }
+
+    PKEY_CACHE = TtlCache(ttl=600, max_size=256)
+
+    key = db.deferred(
+        db.Column(StringEncryptedType(db.String, SECRET_KEY, CredentialEngine)),
+        group="secrets",
+    )
     key_type = db.Column(
         db.Enum(*KEY_TYPES.keys(), name="ssh_key_type", validate_strings=True)
     )
@@ -38,9 +62,23 @@ class SshCredential(Credential):
     @classmethod
     def get_pkey(cls, key_text, key_type, password=None):
         key_file = StringIO(key_text)
-        pkey_cls = cls.KEY_TYPES[key_type]
+        pkey_cls = getattr(paramiko, cls.KEY_TYPES[key_type])
         return pkey_cls.from_private_key(key_file, password)
 
+    def get_cached_pkey(self, password=None):
+        content = "\0".join((self.key_type, self.key, password or ""))
+        cache_key = (self.id, sha256(content.encode()).hexdigest())
+
+        pkey = self.PKEY_CACHE.get(cache_key)
+        if pkey is None:
+            pkey = self.get_pkey(self.key, self.key_type, password)
+            self.PKEY_CACHE.put(cache_key, pkey)
+        return pkey
+
+    @classmethod
+    def invalidate_cached_pkey(cls, credential_id):
+        cls.PKEY_CACHE.invalidate(lambda cache_key: cache_key[0] == credential_id)
+
 
 class Password(SshCredential):
     PROVIDER_NAME = "password"
@@ -78,7 +116,7 @@ class SshKeyNoPassword(SshCredential):
         self.key_type = key_type
 
     def get_ssh_credentials(self):
-        pkey = self.get_pkey(self.key, self.key_type)
+        pkey = self.get_cached_pkey()
         return self.username, None, pkey
 
 
@@ -100,5 +138,49 @@ class SshKeyWithPassword(SshCredential):
         self.key_type = key_type
 
     def get_ssh_credentials(self):
-        pkey = self.get_pkey(self.key, self.key_type, self.secret)
+        pkey = self.get_cached_pkey(self.secret)
         return self.username, self.secret, pkey
+
+
+ENCRYPTED_COLUMNS = ("username", "secret", "key")
+
+
+def raw_column(name):
+    return type_coerce(Credential.__table__.c[name], db.String)
+
+
+def matches_raw(name, value):
+    column = raw_column(name)
+    return column.is_(None) if value is None else column == value
+
+
+def reencrypt_batch(after_id=0, batch_size=100):
+    table = Credential.__table__
+    rows = db.session.execute(
+        select(table.c.id, *(raw_column(name) for name in ENCRYPTED_COLUMNS))
+        .where(table.c.id > after_id)
+        .order_by(table.c.id)
+        .limit(batch_size)
+    ).all()
+
+    updated = 0
+    for id, *values in rows:
+        new_values = [KEYRING.reencrypt(value) for value in values]
+        if new_values == values:
+            continue
+        result = db.session.execute(
+            update(table)
+            .where(
+                table.c.id == id,
+                *(matches_raw(n, v) for n, v in zip(ENCRYPTED_COLUMNS, values)),
+            )
+            .values(
+                {
+                    table.c[name]: literal(value, db.String)
+                    for name, value in zip(ENCRYPTED_COLUMNS, new_values)
+                }
+            )
+        )
+        updated += result.rowcount
+    db.session.commit()
+    return (rows[-1].id if rows else None), updated
@@ -1,6 +1,14 @@
+from functools import partial
+from itertools import chain, groupby
+
+from sqlalchemy import event
+
 from app import db
-from model.base import OperationProvider
-from utils import execute_operations
+from model.base import BASIC_OPS, OperationProvider
+from model.version import Versioned
+from utils.step_runner import execute_operations
+
+BASIC_OP_NAMES = {op.name for op in BASIC_OPS}
 
 association_table = db.Table(
     "machine_custom_operation",
@@ -12,17 +20,19 @@ association_table = db.Table(
         "operation_id",
         db.ForeignKey("custom_operation.id", ondelete="CASCADE"),
         primary_key=True,
+        index=True,
     ),
 )
 
 
-class CustomOperation(db.Model):
+class CustomOperation(db.Model, Versioned):
     __tablename__ = "custom_operation"
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(127), unique=True)
     description = db.Column(db.String(255))
     ops = db.Column(db.JSON)
+    plan = db.Column(db.JSON)
 
     machines = db.relationship(
         "Machine", secondary=association_table, back_populates="custom_operations"
@@ -34,17 +44,84 @@ class CustomOperation(db.Model):
         self.description = description
         self.ops = ops
 
+    def get_plan(self):
+        return self.ops if self.plan is None else self.plan
+
+
+def compile_step(name, step, ops_by_name, path):
+    op_name = step["op_name"]
+    if op_name in BASIC_OP_NAMES:
+        return [{"op_name": op_name, "argument": step.get("argument")}]
+    if op_name in ops_by_name:
+        return compile_plan(op_name, ops_by_name, (*path, name))
+    raise ValueError(f"custom operation '{name}' uses unknown step '{op_name}'")
+
+
+def compile_plan(name, ops_by_name, path=()):
+    if name in path:
+        cycle = " -> ".join((*path, name))
+        raise ValueError(f"custom operation '{name}' includes itself: {cycle}")
+
+    plan = []
+    for group, steps in groupby(ops_by_name[name], key=lambda step: step.get("group")):
+        branches = [compile_step(name, step, ops_by_name, path) for step in steps]
+        if group is None or len(branches) == 1:
+            plan.extend(chain.from_iterable(branches))
+        else:
+            plan.append({"parallel": branches})
+    return plan
+
+
+def compile_plans(custom_ops):
+    ops_by_name = {custom_op.name: custom_op.ops for custom_op in custom_ops}
+    errors = {}
+    for custom_op in custom_ops:
+        try:
+            custom_op.plan = compile_plan(custom_op.name, ops_by_name)
+        except ValueError as e:
+            errors[custom_op] = e
+    return errors
+
+
+def recompile_plans(custom_ops, changed=None):
+    # Legacy operations saved before plans existed may not compile. They keep
+    # running their raw steps and must not block saving unrelated operations.
+    for custom_op, error in compile_plans(custom_ops).items():
+        if custom_op is changed or custom_op.plan is not None:
+            raise error
+
 
 class CustomOperationProvider(OperationProvider):
     def __init__(self, machine):
         self.operations = {}
         for custom_op in machine.custom_operations:
-            process = custom_op.ops
-
-            def custom_op_func():
-                execute_operations(machine, process)
-
+            custom_op_func = partial(execute_operations, machine, custom_op.get_plan())
             self.operations[custom_op.name] = (custom_op_func, custom_op.description)
 
     def get_operations(self):
         return self.operations
+
+
+@event.listens_for(CustomOperation.name, "set")
+@event.listens_for(CustomOperation.description, "set")
+@event.listens_for(CustomOperation.ops, "set")
+@event.listens_for(CustomOperation.plan, "set")
+def invalidate_dispatch_tables(custom_op, *_):
+    # Only machines that loaded their custom operations can hold a dispatch table,
+    # so avoid lazy loading the whole reverse relationship from inside the event.
+    state = db.inspect(custom_op)
+    if "machines" not in state.unloaded:
+        machines = custom_op.machines
+    elif state.session is not None:
+        machines = [
+            obj
+            for obj in state.session.identity_map.values()
+            if hasattr(obj, "invalidate_dispatch_table")
+            and "custom_operations" not in db.inspect(obj).unloaded
+            and custom_op in obj.custom_operations
+        ]
+    else:
+        machines = []
+
+    for machine in machines:
+        machine.invalidate_dispatch_table()
@@ -0,0 +1,9 @@
+from app import db
+
+
+class Draft(db.Model):
+    __tablename__ = "draft"
+
+    id = db.Column(db.String(64), primary_key=True)
+    data = db.Column(db.Text, nullable=False)
+    expires_time = db.Column(db.TIMESTAMP(), nullable=False, index=True)
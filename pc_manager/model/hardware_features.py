@@ -1,15 +1,18 @@
+from collections import defaultdict
+from functools import partial
 from time import sleep, time
 from urllib.parse import urlunparse
 
-import libvirt
 from sqlalchemy.dialects.postgresql import UUID, MACADDR
-from wakeonlan import send_magic_packet
 
 from app import db
 from model.base import (
     OperationProvider,
     MachineStatus,
     StatusManager,
+    STATUS_CACHE,
+    cached_status,
+    invalidates_status,
     RESUME_OP,
     GET_STATUS_OP,
     ENSURE_STATUS_OP,
@@ -18,6 +21,13 @@ from model.base import (
     SUSPEND_OP,
     REBOOT_OP,
 )
+from utils import lazy_import
+from utils.libvirt_events import libvirt_events
+from utils.libvirt_pool import libvirt_pool
+from utils.single_flight import SingleFlight
+
+libvirt = lazy_import("libvirt")
+wakeonlan = lazy_import("wakeonlan")
 
 
 class HardwareFeatures(db.Model, OperationProvider, StatusManager):
@@ -40,6 +50,9 @@ class HardwareFeatures(db.Model, OperationProvider, StatusManager):
         uselist=False,
     )
 
+    def get_versioned_owner(self):
+        return self.machine
+
 
 class WakeOnLan(HardwareFeatures):
     PROVIDER_NAME = "wakeonlan"
@@ -48,18 +61,44 @@ class WakeOnLan(HardwareFeatures):
     __mapper_args__ = {"polymorphic_identity": PROVIDER_NAME}
 
     RESUME_TIMEOUT = 20
+    BROADCAST_ADDRESS = "255.255.255.255"
+    REPEAT_COUNT = 3
+    MAX_REPEAT_COUNT = 10
 
     mac_address = db.Column(MACADDR)
+    broadcast_address = db.Column(db.String(15))
 
-    def __init__(self, mac_address, id=None):
+    def __init__(self, mac_address, broadcast_address=None, id=None):
         self.id = id
         self.mac_address = mac_address
+        self.broadcast_address = broadcast_address
 
+    def get_broadcast_address(self):
+        return self.broadcast_address or self.BROADCAST_ADDRESS
+
+    @invalidates_status
     def __resume(self):
-        send_magic_packet(self.mac_address)
+        wakeonlan.send_magic_packet(
+            self.mac_address, ip_address=self.get_broadcast_address()
+        )
+
+    @classmethod
+    def send_magic_packets(cls, features, repeat=REPEAT_COUNT):
+        mac_addresses = defaultdict(list)
+        for feature in features:
+            mac_addresses[feature.get_broadcast_address()].append(feature.mac_address)
+
+        for _ in range(repeat):
+            for broadcast_address, macs in mac_addresses.items():
+                wakeonlan.send_magic_packet(*macs, ip_address=broadcast_address)
+        for feature in features:
+            feature.invalidate_status()
 
     def get_properties(self):
-        return {"MAC address": self.mac_address}
+        return {
+            "MAC address": self.mac_address,
+            "Broadcast address": self.get_broadcast_address(),
+        }
 
     def get_operations(self):
         return {
@@ -67,9 +106,14 @@ class WakeOnLan(HardwareFeatures):
             ENSURE_STATUS_OP.name: (self.ensure_status, ENSURE_STATUS_OP.description),
         }
 
+    def get_status_check(self):
+        return lambda: MachineStatus.UNKNOWN
+
+    @cached_status
     def get_status(self):
         return MachineStatus.UNKNOWN
 
+    @invalidates_status
     def ensure_status(self, target_status):
         current_status = self.machine.get_status()
         if target_status == MachineStatus.POWER_ON and target_status != current_status:
@@ -78,7 +122,7 @@ class WakeOnLan(HardwareFeatures):
             timeout = time() + self.RESUME_TIMEOUT
             while current_status != MachineStatus.POWER_ON and time() < timeout:
                 sleep(2)
-                current_status = self.machine.get_status()
+                current_status = self.machine.get_status(use_cache=False)
 
         return current_status
 
@@ -90,9 +134,14 @@ class LibvirtGuest(HardwareFeatures):
     __mapper_args__ = {"polymorphic_identity": PROVIDER_NAME}
 
     OPERATION_TIMEOUT = 10
+    EVENT_POLL_INTERVAL = 5
+    HOST_AWAKE_WINDOW = 30
+    HOST_WAKEUPS = SingleFlight()
 
     host_id = db.Column(
-        db.Integer, db.ForeignKey("software_platform.id", ondelete="SET NULL")
+        db.Integer,
+        db.ForeignKey("software_platform.id", ondelete="SET NULL"),
+        index=True,
     )
     vm_uuid = db.Column(UUID(as_uuid=True))
 
@@ -105,36 +154,69 @@ class LibvirtGuest(HardwareFeatures):
         self.host_id = host_id
         self.vm_uuid = vm_uuid
 
-    def get_connection_to_host(self):
-        software_platform = self.libvirt_host_platform
-        host_machine = software_platform.machine
-
-        if host_machine.ensure_status(MachineStatus.POWER_ON) != MachineStatus.POWER_ON:
+    @staticmethod
+    def get_host_awake_key(host_machine):
+        return (host_machine.id, host_machine.__tablename__, host_machine.id)
+
+    @classmethod
+    def is_host_powered_on(cls, host_machine):
+        awake_key = cls.get_host_awake_key(host_machine)
+        if STATUS_CACHE.get(awake_key) == MachineStatus.POWER_ON:
+            return True
+
+        if host_machine.get_status() != MachineStatus.POWER_ON:
+            return False
+        STATUS_CACHE.put(awake_key, MachineStatus.POWER_ON, ttl=cls.HOST_AWAKE_WINDOW)
+        return True
+
+    def wake_host(self):
+        host_machine = self.libvirt_host_platform.machine
+        awake_key = self.get_host_awake_key(host_machine)
+        if STATUS_CACHE.get(awake_key) == MachineStatus.POWER_ON:
+            return
+
+        status = self.HOST_WAKEUPS.do(
+            host_machine.id, partial(host_machine.ensure_status, MachineStatus.POWER_ON)
+        )
+        if status != MachineStatus.POWER_ON:
             raise Exception("could not wake libvirt host")
+        STATUS_CACHE.put(awake_key, status, ttl=self.HOST_AWAKE_WINDOW)
+
+    def get_host_url(self):
+        hostname = self.libvirt_host_platform.hostname
+        return urlunparse(("qemu+ssh", hostname, "system", None, None, None))
 
-        url = urlunparse(("qemu+ssh", software_platform.hostname, "system", None, None, None))
-        return libvirt.open(url)
+    def get_connection_to_host(self):
+        self.wake_host()
+
+        url = self.get_host_url()
+        return libvirt_pool.get((self.libvirt_host_platform.id, url), url)
 
     def get_domain(self):
         conn = self.get_connection_to_host()
         return conn.lookupByUUID(self.vm_uuid.bytes)
 
+    @invalidates_status
     def start(self):
         domain = self.get_domain()
         domain.create()
 
+    @invalidates_status
     def shutdown(self):
         domain = self.get_domain()
         domain.shutdown()
 
+    @invalidates_status
     def resume(self):
         domain = self.get_domain()
         domain.resume()
 
+    @invalidates_status
     def suspend(self):
         domain = self.get_domain()
         domain.suspend()
 
+    @invalidates_status
     def reboot(self):
         domain = self.get_domain()
         domain.reboot()
@@ -156,12 +238,9 @@ class LibvirtGuest(HardwareFeatures):
             ENSURE_STATUS_OP.name: (self.ensure_status, ENSURE_STATUS_OP.description),
         }
 
-    def get_status(self):
-        if self.libvirt_host_platform.machine.get_status() != MachineStatus.POWER_ON:
-            return MachineStatus.UNKNOWN
-
-        status, _ = self.get_domain().state()
-        match status:
+    @staticmethod
+    def get_domain_status(state):
+        match state:
             case libvirt.VIR_DOMAIN_RUNNING | libvirt.VIR_DOMAIN_SHUTDOWN:
                 return MachineStatus.POWER_ON
             case libvirt.VIR_DOMAIN_SHUTOFF | libvirt.VIR_DOMAIN_CRASHED:
@@ -171,24 +250,98 @@ class LibvirtGuest(HardwareFeatures):
             case _:
                 return MachineStatus.UNKNOWN
 
+    def get_host_status_check(self):
+        host_machine = self.libvirt_host_platform.machine
+        awake_key = self.get_host_awake_key(host_machine)
+        if STATUS_CACHE.get(awake_key) == MachineStatus.POWER_ON:
+            return lambda: MachineStatus.POWER_ON
+        return host_machine.get_status_check()
+
+    def get_status_check(self):
+        if self.libvirt_host_platform is None:
+            return lambda: MachineStatus.UNKNOWN
+
+        url = self.get_host_url()
+        return partial(
+            self.check_status,
+            self.get_host_status_check(),
+            (self.libvirt_host_platform.id, url),
+            url,
+            self.vm_uuid.bytes,
+        )
+
+    @classmethod
+    def check_status(cls, host_status_check, conn_key, url, vm_uuid):
+        if host_status_check() != MachineStatus.POWER_ON:
+            return MachineStatus.UNKNOWN
+
+        conn = libvirt_pool.get(conn_key, url)
+        state, _ = conn.lookupByUUID(vm_uuid).state()
+        return cls.get_domain_status(state)
+
+    @cached_status
+    def get_status(self):
+        if not self.is_host_powered_on(self.libvirt_host_platform.machine):
+            return MachineStatus.UNKNOWN
+
+        state, _ = self.get_domain().state()
+        return self.get_domain_status(state)
+
+    @classmethod
+    def get_bulk_status(cls, guests):
+        guests_by_host = defaultdict(list)
+        for guest in guests:
+            guests_by_host[guest.host_id].append(guest)
+
+        statuses = {}
+        for host_guests in guests_by_host.values():
+            statuses |= cls.get_host_guests_status(host_guests)
+        for guest in guests:
+            if (key := guest.get_status_cache_key()) is not None:
+                STATUS_CACHE.put(key, statuses[guest.id])
+        return statuses
+
+    @classmethod
+    def get_host_guests_status(cls, guests):
+        host_platform = guests[0].libvirt_host_platform
+        if host_platform is None or not cls.is_host_powered_on(host_platform.machine):
+            return {guest.id: MachineStatus.UNKNOWN for guest in guests}
+
+        conn = guests[0].get_connection_to_host()
+        domain_stats = conn.getAllDomainStats(stats=libvirt.VIR_DOMAIN_STATS_STATE)
+        domain_states = {
+            domain.UUID(): stats["state.state"] for domain, stats in domain_stats
+        }
+        return {
+            guest.id: cls.get_domain_status(domain_states.get(guest.vm_uuid.bytes))
+            for guest in guests
+        }
+
+    @invalidates_status
     def ensure_status(self, target_status):
         current_status = self.get_status()
         if target_status != current_status:
             domain = self.get_domain()
 
-            match (target_status, self.get_status()):
-                case (MachineStatus.POWER_ON, MachineStatus.POWER_OFF):
-                    domain.create()
-                case (MachineStatus.POWER_ON, MachineStatus.SUSPENDED):
-                    domain.resume()
-                case (MachineStatus.POWER_OFF, _):
-                    domain.shutdown()
-                case (MachineStatus.SUSPENDED, _):
-                    domain.suspend()
-
-            timeout = time() + self.OPERATION_TIMEOUT
-            while current_status != target_status and time() < timeout:
-                sleep(1)
-                current_status = self.get_status()
+            with libvirt_events.lifecycle_events(domain) as lifecycle_event:
+                match (target_status, self.get_status()):
+                    case (MachineStatus.POWER_ON, MachineStatus.POWER_OFF):
+                        domain.create()
+                    case (MachineStatus.POWER_ON, MachineStatus.SUSPENDED):
+                        domain.resume()
+                    case (MachineStatus.POWER_OFF, _):
+                        domain.shutdown()
+                    case (MachineStatus.SUSPENDED, _):
+                        domain.suspend()
+
+                timeout = time() + self.OPERATION_TIMEOUT
+                while current_status != target_status and time() < timeout:
+                    if lifecycle_event is None:
+                        sleep(1)
+                    else:
+                        remaining = timeout - time()
+                        lifecycle_event.wait(min(self.EVENT_POLL_INTERVAL, remaining))
+                        lifecycle_event.clear()
+                    current_status = self.get_status(use_cache=False)
 
         return current_status
@@ -0,0 +1,72 @@
+from enum import Enum
+
+from app import db
+from model.base import MachineStatus
+
+
+class JobStatus(Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+
+class Job(db.Model):
+    __tablename__ = "job"
+
+    id = db.Column(db.Integer, primary_key=True)
+    machine_id = db.Column(
+        db.Integer,
+        db.ForeignKey("machine.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+    )
+    description = db.Column(db.String(255))
+
+    steps = db.Column(db.JSON)
+    target_status = db.Column(
+        db.Enum(MachineStatus, name="machine_status", validate_strings=True)
+    )
+
+    status = db.Column(
+        db.Enum(JobStatus, name="job_status", validate_strings=True),
+        nullable=False,
+        default=JobStatus.QUEUED,
+    )
+    current_step = db.Column(db.Integer, nullable=False, default=0)
+    results = db.Column(db.JSON, nullable=False, default=list)
+    error = db.Column(db.Text)
+
+    created_time = db.Column(
+        db.TIMESTAMP(), nullable=False, server_default=db.func.now()
+    )
+    started_time = db.Column(db.TIMESTAMP())
+    finished_time = db.Column(db.TIMESTAMP(), index=True)
+    lease_expires_time = db.Column(db.TIMESTAMP())
+
+    machine = db.relationship("Machine", uselist=False)
+
+    def __init__(self, machine, description, steps=None, target_status=None):
+        self.machine = machine
+        self.description = description
+        self.steps = steps or []
+        self.target_status = target_status
+        self.status = JobStatus.QUEUED
+        self.current_step = 0
+        self.results = []
+
+    def is_finished(self):
+        return self.status in (JobStatus.SUCCEEDED, JobStatus.FAILED)
+
+    def get_step_states(self):
+        states = []
+        for index, step in enumerate(self.steps):
+            if index < len(self.results):
+                states.append((step, "done", self.results[index]))
+            elif index == self.current_step and self.status == JobStatus.RUNNING:
+                states.append((step, "running", None))
+            elif index == self.current_step and self.status == JobStatus.FAILED:
+                states.append((step, "failed", self.error))
+            else:
+                states.append((step, "pending", None))
+        return states
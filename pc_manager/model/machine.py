@@ -1,23 +1,31 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datetime import datetime
+from functools import partial
 
+from sqlalchemy import event, func
 from sqlalchemy.ext.orderinglist import ordering_list
+from sqlalchemy.orm import joinedload, selectinload, with_polymorphic
 
-from app import db
+from app import db, RACE_STATUS_MANAGERS
 from model.base import MachineStatus
 from model.custom_operation import association_table, CustomOperationProvider
+from model.hardware_features import HardwareFeatures
+from model.software_platform import SoftwarePlatform
+from model.version import Versioned
 
 
-class Machine(db.Model):
+class Machine(db.Model, Versioned):
     __tablename__ = "machine"
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(127), nullable=False, unique=True)
-    place = db.Column(db.String(127))
+    place = db.Column(db.String(127), index=True)
 
     last_status = db.Column(
         db.Enum(MachineStatus, name="machine_status", validate_strings=True),
         nullable=False,
         default=MachineStatus.UNKNOWN,
+        index=True,
     )
     last_status_time = db.Column(db.TIMESTAMP(), nullable=False, server_default="now()")
 
@@ -51,6 +59,10 @@ class Machine(db.Model):
         self.software_platforms = software_platforms
         self.custom_operations = custom_operations
 
+    @classmethod
+    def query_with_providers(cls):
+        return cls.query.options(*get_provider_loaders())
+
     def get_operation_providers(self):
         return [
             p
@@ -69,27 +81,77 @@ class Machine(db.Model):
             if p is not None
         ]
 
+    def get_dispatch_table(self):
+        dispatch_table = getattr(self, "_dispatch_table", None)
+        if dispatch_table is None:
+            dispatch_table = {}
+            for provider in self.get_operation_providers():
+                for name, (op, description) in provider.get_operations().items():
+                    dispatch_table.setdefault(name, []).append((op, description))
+            self._dispatch_table = dispatch_table
+        return dispatch_table
+
+    def invalidate_dispatch_table(self):
+        self._dispatch_table = None
+
+    def get_available_operations(self):
+        return {name: ops[0] for name, ops in self.get_dispatch_table().items()}
+
     def execute_action(self, name, action_args):
-        operation_providers = self.get_operation_providers()
+        if name not in self.get_dispatch_table():
+            raise Exception(f"operation not found for machine {self.name}", name)
+
         errors = []
-        for provider in operation_providers:
-            operations = provider.get_operations()
+        for op, _ in self.get_dispatch_table()[name]:
             try:
-                op = operations[name][0]
                 return op(*action_args)
-            except KeyError:
-                continue
             except Exception as exc:
                 errors.append(exc)
-        if errors:
-            raise Exception("execute_action failed: all providers failed", errors)
-        else:
-            raise Exception(f"operation not found for machine {self.name}", name)
+        raise Exception("execute_action failed: all providers failed", errors)
 
-    def get_status(self):
+    def get_status_check(self):
+        checks = [p.get_status_check() for p in self.get_status_managers()]
+        return partial(first_known_status, checks)
+
+    def race_status_managers(self, status_managers, use_cache=True):
+        if use_cache:
+            for provider in status_managers:
+                status = provider.get_cached_status()
+                if status not in (None, MachineStatus.UNKNOWN):
+                    return status
+
+        # The racing threads only see plain data collected here, never this session
+        # or its objects, and only the winner is written to the status cache.
+        checks = [p.get_status_check() for p in status_managers]
+        executor = ThreadPoolExecutor(max_workers=len(checks))
+        try:
+            futures = {
+                executor.submit(check): p for check, p in zip(checks, status_managers)
+            }
+            pending = set(futures)
+            while pending:
+                _, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future, provider in futures.items():
+                    if future.done() and not future.exception():
+                        if future.result() != MachineStatus.UNKNOWN:
+                            provider.cache_status(future.result())
+                            return future.result()
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        for future in futures:
+            if future.exception():
+                raise future.exception()
+        return MachineStatus.UNKNOWN
+
+    def get_status(self, use_cache=True, race=None):
         status_managers = self.get_status_managers()
+        race = RACE_STATUS_MANAGERS if race is None else race
+        if race and len(status_managers) > 1:
+            return self.race_status_managers(status_managers, use_cache)
+
         for provider in status_managers:
-            status = provider.get_status()
+            status = provider.get_status(use_cache)
             if status != MachineStatus.UNKNOWN:
                 return status
         return MachineStatus.UNKNOWN
@@ -103,3 +165,49 @@ class Machine(db.Model):
                 self.last_status_time = datetime.now()
                 return status
         return self.get_status()
+
+
+def first_known_status(status_checks):
+    for status_check in status_checks:
+        status = status_check()
+        if status != MachineStatus.UNKNOWN:
+            return status
+    return MachineStatus.UNKNOWN
+
+
+SORT_COLUMNS = {
+    "name": Machine.name,
+    "place": func.coalesce(Machine.place, ""),
+    "status": Machine.last_status,
+    "status_time": Machine.last_status_time,
+}
+
+for sort_name, sort_column in SORT_COLUMNS.items():
+    db.Index(f"ix_machine_sort_{sort_name}", sort_column, Machine.id)
+
+
+def get_provider_loaders():
+    hardware = with_polymorphic(HardwareFeatures, "*")
+    platforms = with_polymorphic(SoftwarePlatform, "*")
+    return (
+        selectinload(Machine.hardware_features.of_type(hardware))
+        .joinedload(hardware.LibvirtGuest.libvirt_host_platform)
+        .joinedload(SoftwarePlatform.machine),
+        selectinload(Machine.software_platforms.of_type(platforms)).joinedload(
+            platforms.SshAccessiblePlatform.credential
+        ),
+        selectinload(Machine.custom_operations),
+    )
+
+
+def invalidate_dispatch_table(machine, *_, **__):
+    machine.invalidate_dispatch_table()
+
+
+for relationship in (
+    Machine.hardware_features,
+    Machine.software_platforms,
+    Machine.custom_operations,
+):
+    for event_name in ("set", "append", "remove", "bulk_replace"):
+        event.listen(relationship, event_name, invalidate_dispatch_table)
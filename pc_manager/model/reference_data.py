@@ -0,0 +1,79 @@
+from collections import namedtuple
+from itertools import chain
+
+from flask import g, has_app_context
+from sqlalchemy import event
+
+from app import db, REFERENCE_CACHE_TTL
+from model.credential import Credential
+from model.custom_operation import CustomOperation
+from model.machine import Machine
+from model.software_platform import LinuxPlatform, SoftwarePlatform
+from utils.cache import TtlCache
+
+ReferenceData = namedtuple(
+    "ReferenceData", ["custom_ops", "linux_hosts", "credentials", "credential_names"]
+)
+
+REFERENCE_CACHE = TtlCache(ttl=REFERENCE_CACHE_TTL)
+REFERENCE_TYPES = (Credential, CustomOperation, SoftwarePlatform)
+
+
+def load_reference_data():
+    custom_ops = (
+        CustomOperation.query.with_entities(
+            CustomOperation.id, CustomOperation.name, CustomOperation.description
+        )
+        .order_by(CustomOperation.name)
+        .all()
+    )
+    linux_hosts = (
+        LinuxPlatform.query.join(LinuxPlatform.machine)
+        .with_entities(LinuxPlatform.id, Machine.name.label("machine_name"))
+        .order_by(Machine.name)
+        .all()
+    )
+    credentials = (
+        Credential.query.with_entities(Credential.id, Credential.name)
+        .order_by(Credential.name)
+        .all()
+    )
+    credential_names = {id: name for id, name in credentials}
+    return ReferenceData(custom_ops, linux_hosts, credentials, credential_names)
+
+
+def get_reference_data():
+    if "reference_data" not in g:
+        reference_data = REFERENCE_CACHE.get("reference_data")
+        if reference_data is None:
+            reference_data = load_reference_data()
+            if REFERENCE_CACHE_TTL > 0:
+                REFERENCE_CACHE.put("reference_data", reference_data)
+        g.reference_data = reference_data
+    return g.reference_data
+
+
+def changes_reference_data(obj):
+    if isinstance(obj, Machine):
+        return db.inspect(obj).attrs.name.history.has_changes()
+    return isinstance(obj, REFERENCE_TYPES)
+
+
+@event.listens_for(db.session, "after_flush")
+def track_reference_changes(session, _):
+    objects = chain(session.new, session.dirty, session.deleted)
+    if any(changes_reference_data(obj) for obj in objects):
+        session.info["reference_data_changed"] = True
+
+
+@event.listens_for(db.session, "after_commit")
+def invalidate_reference_data(session):
+    if session.info.pop("reference_data_changed", False):
+        REFERENCE_CACHE.invalidate()
+        if has_app_context():
+            g.pop("reference_data", None)
+
+
+@event.listens_for(db.session, "after_rollback")
+def discard_reference_changes(session):
+    session.info.pop("reference_data_changed", None)
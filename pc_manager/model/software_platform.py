@@ -1,12 +1,14 @@
 import socket
-
-from paramiko.client import SSHClient
+from functools import partial
 
 from app import db
 from model.base import (
     OperationProvider,
     MachineStatus,
     StatusManager,
+    StatusProbe,
+    cached_status,
+    invalidates_status,
     SHUTDOWN_OP,
     SUSPEND_OP,
     REBOOT_OP,
@@ -14,6 +16,41 @@ from model.base import (
     ENSURE_STATUS_OP,
     EXECUTE_COMMAND_OP,
 )
+from utils import lazy_import
+from utils.probe import probe_ssh
+from utils.ssh_pool import ssh_pool
+
+paramiko = lazy_import("paramiko")
+
+
+def connect_to_server(hostname, ssh_credentials, timeout=None):
+    ssh_client = paramiko.SSHClient()
+    ssh_client.load_system_host_keys()
+
+    (username, password, pkey) = ssh_credentials
+    ssh_client.connect(
+        hostname,
+        username=username,
+        password=password,
+        pkey=pkey,
+        timeout=timeout,
+    )
+
+    return ssh_client
+
+
+def check_ssh_status(hostname, probe, timeout, pool_key=None, ssh_credentials=None):
+    try:
+        read_banner = probe != StatusProbe.TCP
+        if not probe_ssh(hostname, read_banner, timeout=timeout):
+            return MachineStatus.UNKNOWN
+        if probe == StatusProbe.AUTH:
+            connect = partial(connect_to_server, hostname, ssh_credentials, timeout)
+            with ssh_pool.connection(pool_key, connect):
+                pass
+        return MachineStatus.POWER_ON
+    except socket.error:
+        return MachineStatus.UNKNOWN
 
 
 class SoftwarePlatform(db.Model, OperationProvider, StatusManager):
@@ -22,7 +59,10 @@ class SoftwarePlatform(db.Model, OperationProvider, StatusManager):
 
     id = db.Column(db.Integer, primary_key=True)
     machine_id = db.Column(
-        db.Integer, db.ForeignKey("machine.id", ondelete="CASCADE"), nullable=False
+        db.Integer,
+        db.ForeignKey("machine.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
     )
     type = db.Column(db.String(31))
     priority = db.Column(db.Integer, nullable=False)
@@ -31,52 +71,70 @@ class SoftwarePlatform(db.Model, OperationProvider, StatusManager):
         "Machine", back_populates="software_platforms", uselist=False
     )
 
+    def get_versioned_owner(self):
+        return self.machine
+
     def is_active(self):
         raise NotImplementedError()
 
 
 class SshAccessiblePlatform(SoftwarePlatform):
+    STATUS_PROBE = StatusProbe.BANNER
+    STATUS_TIMEOUT = 2
+
     hostname = db.Column(db.String(127))
     credential_id = db.Column(
-        db.Integer, db.ForeignKey("credential.id", ondelete="SET NULL")
+        db.Integer, db.ForeignKey("credential.id", ondelete="SET NULL"), index=True
+    )
+    status_probe = db.Column(
+        db.Enum(
+            *(p.value for p in StatusProbe), name="status_probe", validate_strings=True
+        )
     )
 
     credential = db.relationship("SshCredential", uselist=False)
 
-    def __init__(self, hostname, credential_id, id=None):
+    def __init__(self, hostname, credential_id, status_probe=None, id=None):
         self.id = id
         self.hostname = hostname
         self.credential_id = credential_id
+        self.status_probe = status_probe
+
+    def get_pool_key(self):
+        return self.hostname, self.credential_id
 
     def connect_to_server(self, timeout=None):
-        ssh_client = SSHClient()
-        ssh_client.load_system_host_keys()
+        ssh_credentials = self.credential.get_ssh_credentials()
+        return connect_to_server(self.hostname, ssh_credentials, timeout)
 
-        (username, password, pkey) = self.credential.get_ssh_credentials()
-        ssh_client.connect(
-            self.hostname,
-            username=username,
-            password=password,
-            pkey=pkey,
-            timeout=timeout,
+    def pooled_connection(self, timeout=None, reuse=True, fresh=False):
+        connect = partial(self.connect_to_server, timeout=timeout)
+        return ssh_pool.connection(
+            self.get_pool_key(), connect, reuse=reuse, fresh=fresh
         )
 
-        return ssh_client
-
     def remote_execute_command(self, command, read_output=True):
-        ssh_client = self.connect_to_server()
-        try:
-            (_, stdout, stderr) = ssh_client.exec_command(command)
-
-            if read_output:
-                stdout_lines = stdout.readlines()
-                stderr_lines = stderr.readlines()
-                return stdout_lines, stderr_lines
-            else:
-                return None
-        finally:
-            ssh_client.close()
-
+        # Commands without output are power state changes, which kill the transport.
+        for fresh in (False, True):
+            with self.pooled_connection(reuse=read_output, fresh=fresh) as ssh_client:
+                try:
+                    (_, stdout, stderr) = ssh_client.exec_command(command)
+                except (EOFError, paramiko.SSHException):
+                    # A pooled transport can die between its probe and the exec.
+                    if fresh:
+                        raise
+                    ssh_client.close()
+                    continue
+
+                if read_output:
+                    stdout_lines = stdout.readlines()
+                    stderr_lines = stderr.readlines()
+                    return stdout_lines, stderr_lines
+                else:
+                    self.invalidate_status()
+                    return None
+
+    @invalidates_status
     def execute_command(self, command):
         self.remote_execute_command(command)
 
@@ -96,14 +154,31 @@ class SshAccessiblePlatform(SoftwarePlatform):
             ),
         }
 
+    def get_status_probe(self):
+        if self.status_probe is None:
+            return self.STATUS_PROBE
+        return StatusProbe(self.status_probe)
+
+    def get_status_check(self):
+        probe = self.get_status_probe()
+        if probe != StatusProbe.AUTH:
+            return partial(check_ssh_status, self.hostname, probe, self.STATUS_TIMEOUT)
+
+        # Only the AUTH probe logs in, TCP and banner probes never read secrets.
+        return partial(
+            check_ssh_status,
+            self.hostname,
+            probe,
+            self.STATUS_TIMEOUT,
+            self.get_pool_key(),
+            self.credential.get_ssh_credentials(),
+        )
+
+    @cached_status
     def get_status(self):
-        try:
-            ssh_client = self.connect_to_server(timeout=2)
-            ssh_client.close()
-            return MachineStatus.POWER_ON
-        except socket.error:
-            return MachineStatus.UNKNOWN
+        return self.get_status_check()()
 
+    @invalidates_status
     def ensure_status(self, target_status):
         current_status = self.get_status()
         match (current_status, target_status):
@@ -0,0 +1,31 @@
+from itertools import chain
+
+from sqlalchemy import event
+
+from app import db
+
+
+class Versioned:
+    version = db.Column(db.Integer, nullable=False, default=1, server_default="1")
+
+    def get_versioned_owner(self):
+        return self
+
+
+def get_versioned_owner(obj):
+    return obj.get_versioned_owner() if hasattr(obj, "get_versioned_owner") else None
+
+
+@event.listens_for(db.session, "before_flush")
+def bump_versions(session, *_):
+    owners = {}
+    for obj in chain(session.dirty, session.new, session.deleted):
+        if obj in session.dirty and not session.is_modified(obj):
+            continue
+        owner = get_versioned_owner(obj)
+        if owner is not None:
+            owners[id(owner)] = owner
+
+    for owner in owners.values():
+        if owner not in session.new and owner not in session.deleted:
+            owner.version = type(owner).version + 1
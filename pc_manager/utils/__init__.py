@@ -1,3 +1,5 @@
+import sys
+from importlib.util import LazyLoader, find_spec, module_from_spec
 from itertools import islice
 from logging import info
 from os import urandom
@@ -14,13 +16,21 @@ def display_duration(to_date, from_date):
     return " ".join(parts)
 
 
-def execute_operations(machine, operations):
-    for op in operations:
-        argument = [op["argument"]] if ("argument" in op and op["argument"]) else []
-        machine.execute_action(op["op_name"], argument)
-
-
 def generate_password():
     password = urandom(32).hex()
     info("Generated random admin password: %s", password)
     return password
+
+
+def lazy_import(name):
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named '{name}'", name=name)
+    loader = LazyLoader(spec.loader)
+    spec.loader = loader
+    module = module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
@@ -0,0 +1,65 @@
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event, Semaphore
+
+from flask import current_app
+
+from app import db
+from model.hardware_features import LibvirtGuest
+from model.machine import Machine
+from utils.step_runner import execute_operations
+
+# Each worker holds a DB connection, keep them below the default pool of 5 + 10.
+MAX_WORKERS = 8
+HOST_CONCURRENCY = 4
+
+
+def get_concurrency_keys(machine_ids):
+    guests = LibvirtGuest.query.with_entities(
+        LibvirtGuest.machine_id, LibvirtGuest.host_id
+    ).filter(LibvirtGuest.machine_id.in_(machine_ids))
+    host_ids = {machine_id: host_id for machine_id, host_id in guests}
+    return {
+        id: ("libvirt_host", host_ids[id]) if host_ids.get(id) else ("machine", id)
+        for id in machine_ids
+    }
+
+
+def execute_steps(steps, machine_id):
+    machine = Machine.query.get(machine_id)
+    for step in steps:
+        execute_operations(machine, [step])
+        db.session.commit()
+
+
+def run_bulk_action(
+    machine_ids,
+    execute,
+    max_workers=MAX_WORKERS,
+    host_concurrency=HOST_CONCURRENCY,
+    fail_fast=False,
+):
+    app = current_app._get_current_object()
+    cancelled = Event()
+    concurrency_keys = get_concurrency_keys(machine_ids)
+    host_limits = {
+        key: Semaphore(host_concurrency) for key in set(concurrency_keys.values())
+    }
+    db.session.commit()
+
+    def execute_on_machine(machine_id):
+        with host_limits[concurrency_keys[machine_id]]:
+            if cancelled.is_set():
+                return machine_id, "skipped"
+            with app.app_context():
+                try:
+                    execute(machine_id)
+                    return machine_id, "success"
+                except Exception as exc:
+                    if fail_fast:
+                        cancelled.set()
+                    return machine_id, f"failed: {exc}"
+                finally:
+                    db.session.remove()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return dict(executor.map(execute_on_machine, machine_ids))
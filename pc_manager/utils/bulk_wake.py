@@ -0,0 +1,42 @@
+from logging import warning
+from time import sleep, time
+
+from app import db
+from model.base import MachineStatus
+from model.hardware_features import WakeOnLan
+from model.machine import Machine
+from utils.status_refresh import run_probes, write_statuses, MAX_WORKERS
+
+
+POLL_INTERVAL = 2
+
+
+def wait_powered_on(_app, status_check):
+    (machine_id, check) = status_check
+    try:
+        timeout = time() + WakeOnLan.RESUME_TIMEOUT
+        status = check()
+        while status != MachineStatus.POWER_ON and time() < timeout:
+            sleep(POLL_INTERVAL)
+            status = check()
+        return {machine_id: status}
+    except Exception as exc:
+        warning("Could not wake machine %s: %s", machine_id, exc)
+        return {machine_id: MachineStatus.UNKNOWN}
+
+
+def wake_machines(machine_ids, repeat=WakeOnLan.REPEAT_COUNT):
+    features = WakeOnLan.query.filter(WakeOnLan.machine_id.in_(machine_ids)).all()
+    WakeOnLan.send_magic_packets(features, repeat)
+
+    # Collect the checks up front and end the transaction, so no DB connection is
+    # held while waiting for the machines to boot.
+    wol_machine_ids = [feature.machine_id for feature in features]
+    machines = Machine.query_with_providers().filter(Machine.id.in_(wol_machine_ids))
+    status_checks = [(machine.id, machine.get_status_check()) for machine in machines]
+    db.session.commit()
+
+    host_timeout = WakeOnLan.RESUME_TIMEOUT * 2
+    statuses = run_probes(wait_powered_on, status_checks, MAX_WORKERS, host_timeout)
+    write_statuses(statuses)
+    return wol_machine_ids, statuses
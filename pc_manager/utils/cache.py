@@ -0,0 +1,38 @@
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+
+MISSING = object()
+
+
+class TtlCache:
+    def __init__(self, ttl, max_size=None):
+        self.ttl = ttl
+        self.max_size = max_size
+
+        self.lock = Lock()
+        self.entries = OrderedDict()
+
+    def get(self, key, default=None):
+        with self.lock:
+            (value, expires) = self.entries.get(key, (MISSING, 0))
+            if value is MISSING:
+                return default
+            if expires < monotonic():
+                del self.entries[key]
+                return default
+            self.entries.move_to_end(key)
+            return value
+
+    def put(self, key, value, ttl=None):
+        with self.lock:
+            self.entries[key] = (value, monotonic() + (ttl or self.ttl))
+            self.entries.move_to_end(key)
+            if self.max_size is not None:
+                while len(self.entries) > self.max_size:
+                    self.entries.popitem(last=False)
+
+    def invalidate(self, predicate=lambda _: True):
+        with self.lock:
+            for key in [k for k in self.entries if predicate(k)]:
+                del self.entries[key]
@@ -0,0 +1,92 @@
+from datetime import datetime, timedelta
+from secrets import token_urlsafe
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from itsdangerous import BadSignature, Signer
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert
+from werkzeug.datastructures import CallbackDict
+
+
+class DraftSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None):
+        def on_update(session):
+            session.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = sid is None
+        self.modified = False
+
+
+class DraftSessionInterface(SessionInterface):
+    SALT = "pc-manager-draft"
+    TTL = timedelta(days=1)
+
+    def __init__(self, db, draft_model, ttl=TTL):
+        self.db = db
+        self.table = draft_model.__table__
+        self.ttl = ttl
+        self.serializer = TaggedJSONSerializer()
+
+    def get_signer(self, app):
+        return Signer(app.secret_key, salt=self.SALT)
+
+    def open_session(self, app, request):
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if not cookie:
+            return DraftSession()
+        try:
+            sid = self.get_signer(app).unsign(cookie).decode()
+        except BadSignature:
+            return DraftSession()
+
+        query = select(self.table.c.data).where(
+            self.table.c.id == sid, self.table.c.expires_time > datetime.now()
+        )
+        with self.db.engine.connect() as conn:
+            data = conn.execute(query).scalar()
+        if data is None:
+            return DraftSession()
+        return DraftSession(self.serializer.loads(data), sid=sid)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if not session:
+            if session.modified and session.sid is not None:
+                query = delete(self.table).where(self.table.c.id == session.sid)
+                with self.db.engine.begin() as conn:
+                    conn.execute(query)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+        if not session.modified:
+            return
+
+        now = datetime.now()
+        expires_time = now + self.ttl
+        sid = session.sid or token_urlsafe(32)
+        data = self.serializer.dumps(dict(session))
+        upsert = insert(self.table).values(id=sid, data=data, expires_time=expires_time)
+        upsert = upsert.on_conflict_do_update(
+            index_elements=[self.table.c.id],
+            set_={"data": data, "expires_time": expires_time},
+        )
+        with self.db.engine.begin() as conn:
+            if session.new:
+                conn.execute(delete(self.table).where(self.table.c.expires_time < now))
+            conn.execute(upsert)
+
+        response.set_cookie(
+            name,
+            self.get_signer(app).sign(sid).decode(),
+            expires=expires_time,
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
@@ -0,0 +1,87 @@
+from base64 import b64decode, b64encode
+from hashlib import sha256
+from os import urandom
+
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from sqlalchemy_utils.types.encrypted.encrypted_type import (
+    AesEngine,
+    EncryptionDecryptionBaseEngine,
+)
+
+
+# Relies on private AesEngine methods; keep in sync with sqlalchemy-utils 0.38.x.
+def make_legacy_engine(legacy_key):
+    engine = AesEngine()
+    engine._update_key(legacy_key)
+    engine._set_padding_mechanism("pkcs5")
+    return engine
+
+
+class Keyring:
+    SEPARATOR = "$"
+    NONCE_SIZE = 12
+
+    def __init__(self, keys, current_key_id, legacy_key=None):
+        if current_key_id not in keys:
+            raise ValueError(f"unknown encryption key id '{current_key_id}'")
+        self.ciphers = {
+            key_id: AESGCM(sha256(key.encode()).digest())
+            for key_id, key in keys.items()
+        }
+        self.current_key_id = current_key_id
+
+        self.legacy_engine = None
+        if legacy_key is not None:
+            self.legacy_engine = make_legacy_engine(legacy_key)
+
+    @classmethod
+    def parse_keys(cls, keys_text):
+        keys = {}
+        for entry in filter(None, keys_text.split(",")):
+            key_id, _, key = entry.partition(":")
+            if not key or cls.SEPARATOR in key_id:
+                raise ValueError(f"malformed encryption key entry for '{key_id}'")
+            keys[key_id] = key
+        return keys
+
+    def get_key_id(self, value):
+        key_id, separator, _ = value.partition(self.SEPARATOR)
+        return key_id if separator and key_id in self.ciphers else None
+
+    def is_current(self, value):
+        return self.get_key_id(value) == self.current_key_id
+
+    def encrypt(self, value):
+        nonce = urandom(self.NONCE_SIZE)
+        cipher = self.ciphers[self.current_key_id]
+        payload = b64encode(nonce + cipher.encrypt(nonce, value.encode(), None))
+        return f"{self.current_key_id}{self.SEPARATOR}{payload.decode()}"
+
+    def decrypt(self, value):
+        key_id = self.get_key_id(value)
+        if key_id is None:
+            if self.legacy_engine is None:
+                raise ValueError("value is not encrypted with a known key")
+            return self.legacy_engine.decrypt(value)
+
+        payload = b64decode(value[len(key_id) + len(self.SEPARATOR) :])
+        nonce, ciphertext = payload[: self.NONCE_SIZE], payload[self.NONCE_SIZE :]
+        return self.ciphers[key_id].decrypt(nonce, ciphertext, None).decode()
+
+    def reencrypt(self, value):
+        if value is None or self.is_current(value):
+            return value
+        return self.encrypt(self.decrypt(value))
+
+
+class KeyringEngine(EncryptionDecryptionBaseEngine):
+    keyring = None
+
+    def _update_key(self, key):
+        pass
+
+    def encrypt(self, value):
+        return self.keyring.encrypt(value)
+
+    def decrypt(self, value):
+        return self.keyring.decrypt(value)
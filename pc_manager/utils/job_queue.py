@@ -0,0 +1,186 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from enum import Enum
+from functools import partial
+from logging import exception
+from threading import Lock
+
+from flask import current_app
+
+from app import db
+from model.job import Job, JobStatus
+from utils.bulk_action import run_bulk_action
+from utils.step_runner import execute_parallel
+
+
+def format_result(result):
+    if result is None:
+        return None
+    if isinstance(result, Enum):
+        return result.value
+    return str(result)
+
+
+class JobQueue:
+    MAX_WORKERS = 4
+    LEASE_DURATION = timedelta(minutes=15)
+
+    def __init__(self, max_workers=MAX_WORKERS):
+        self.max_workers = max_workers
+        self.lock = Lock()
+        self.executor = None
+
+    def get_executor(self):
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="job-worker"
+                )
+            return self.executor
+
+    def submit(self, job_id, app=None):
+        app = app or current_app._get_current_object()
+        self.get_executor().submit(self.run, app, job_id)
+
+    def submit_bulk(self, job_ids, app=None, **options):
+        app = app or current_app._get_current_object()
+        self.get_executor().submit(self.run_bulk, app, job_ids, options)
+
+    def submit_task(self, task, *args, app=None):
+        app = app or current_app._get_current_object()
+        self.get_executor().submit(self.run_task, app, task, args)
+
+    @staticmethod
+    def run_task(app, task, args):
+        with app.app_context():
+            try:
+                task(*args)
+            except Exception:
+                exception("Background task %s crashed", task.__name__)
+            finally:
+                db.session.remove()
+
+    def resume(self, app):
+        with app.app_context():
+            now = datetime.now()
+            Job.query.filter(
+                Job.status == JobStatus.RUNNING,
+                db.or_(Job.lease_expires_time.is_(None), Job.lease_expires_time < now),
+            ).update(
+                {
+                    "status": JobStatus.FAILED,
+                    "error": "interrupted by a restart",
+                    "finished_time": now,
+                },
+                synchronize_session=False,
+            )
+            db.session.commit()
+            queued = Job.query.filter_by(status=JobStatus.QUEUED).order_by(Job.id)
+            for (job_id,) in queued.with_entities(Job.id):
+                self.submit(job_id, app)
+
+    def claim(self, job_id):
+        now = datetime.now()
+        claimed = Job.query.filter_by(id=job_id, status=JobStatus.QUEUED).update(
+            {
+                "status": JobStatus.RUNNING,
+                "started_time": now,
+                "lease_expires_time": now + self.LEASE_DURATION,
+            },
+            synchronize_session=False,
+        )
+        db.session.commit()
+        return claimed == 1
+
+    def renew_lease(self, job):
+        job.lease_expires_time = datetime.now() + self.LEASE_DURATION
+
+    def run(self, app, job_id):
+        with app.app_context():
+            try:
+                if self.claim(job_id):
+                    self.run_job(Job.query.get(job_id))
+            except Exception:
+                exception("Job %s crashed", job_id)
+            finally:
+                db.session.remove()
+
+    def run_bulk(self, app, job_ids, options):
+        with app.app_context():
+            try:
+                machine_ids = list(job_ids)
+                execute = partial(self.run_bulk_job, job_ids)
+                results = run_bulk_action(machine_ids, execute, **options)
+
+                skipped = [
+                    job_ids[id] for id, result in results.items() if result == "skipped"
+                ]
+                Job.query.filter(
+                    Job.id.in_(skipped), Job.status == JobStatus.QUEUED
+                ).update(
+                    {
+                        "status": JobStatus.FAILED,
+                        "error": "skipped after an earlier failure",
+                        "finished_time": datetime.now(),
+                    },
+                    synchronize_session=False,
+                )
+                db.session.commit()
+            except Exception:
+                exception("Bulk jobs %s crashed", list(job_ids.values()))
+            finally:
+                db.session.remove()
+
+    def run_bulk_job(self, job_ids, machine_id):
+        job_id = job_ids[machine_id]
+        if not self.claim(job_id):
+            return
+        job = Job.query.get(job_id)
+        self.run_job(job)
+        if job.status == JobStatus.FAILED:
+            raise Exception(job.error)
+
+    @staticmethod
+    def run_status_change(job, machine):
+        new_status = machine.ensure_status(job.target_status)
+        machine.last_status = new_status
+        machine.last_status_time = datetime.now()
+
+        job.results = [new_status.value]
+        if new_status == job.target_status:
+            job.status = JobStatus.SUCCEEDED
+        else:
+            job.status = JobStatus.FAILED
+            job.error = f"Could not set status, machine is {new_status.value}"
+
+    def run_steps(self, job, machine):
+        for index, step in enumerate(job.steps):
+            job.current_step = index
+            self.renew_lease(job)
+            db.session.commit()
+
+            if "parallel" in step:
+                execute_parallel(machine, step["parallel"])
+                result = None
+            else:
+                argument = [step["argument"]] if step.get("argument") else []
+                result = machine.execute_action(step["op_name"], argument)
+            job.results = [*job.results, format_result(result)]
+        job.status = JobStatus.SUCCEEDED
+
+    def run_job(self, job):
+        try:
+            if job.target_status is not None:
+                self.run_status_change(job, job.machine)
+            else:
+                self.run_steps(job, job.machine)
+        except Exception as exc:
+            db.session.rollback()
+            job.status = JobStatus.FAILED
+            job.error = str(exc)
+        finally:
+            job.finished_time = datetime.now()
+            db.session.commit()
+
+
+job_queue = JobQueue()
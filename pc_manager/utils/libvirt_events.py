@@ -0,0 +1,54 @@
+from contextlib import contextmanager
+from logging import warning
+from threading import Event, Lock, Thread
+
+from utils import lazy_import
+
+libvirt = lazy_import("libvirt")
+
+
+class LibvirtEventLoop:
+    def __init__(self):
+        self.lock = Lock()
+        self.thread = None
+
+    def start(self):
+        with self.lock:
+            if self.thread is None:
+                libvirt.virEventRegisterDefaultImpl()
+                self.thread = Thread(
+                    target=self.run, name="libvirt-events", daemon=True
+                )
+                self.thread.start()
+
+    def run(self):
+        while True:
+            if libvirt.virEventRunDefaultImpl() < 0:
+                warning("libvirt event loop iteration failed")
+
+    @contextmanager
+    def lifecycle_events(self, domain):
+        event = Event()
+        conn = domain.connect()
+        try:
+            callback_id = conn.domainEventRegisterAny(
+                domain,
+                libvirt.VIR_DOMAIN_EVENT_ID_LIFECYCLE,
+                lambda *_: event.set(),
+                None,
+            )
+        except libvirt.libvirtError as exc:
+            warning("Could not register libvirt lifecycle callback: %s", exc)
+            yield None
+            return
+
+        try:
+            yield event
+        finally:
+            try:
+                conn.domainEventDeregisterAny(callback_id)
+            except libvirt.libvirtError:
+                pass
+
+
+libvirt_events = LibvirtEventLoop()
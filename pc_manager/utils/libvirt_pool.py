@@ -0,0 +1,88 @@
+from threading import Lock, Thread
+from time import monotonic, sleep
+
+from utils import lazy_import
+from utils.libvirt_events import libvirt_events
+
+libvirt = lazy_import("libvirt")
+
+
+class LibvirtConnectionPool:
+    IDLE_TIMEOUT = 300
+    KEEPALIVE_INTERVAL = 2
+    KEEPALIVE_COUNT = 2
+
+    def __init__(self, idle_timeout=IDLE_TIMEOUT):
+        self.idle_timeout = idle_timeout
+
+        self.lock = Lock()
+        self.connections = {}
+        self.reaper = None
+
+    @staticmethod
+    def is_alive(conn):
+        try:
+            return conn.isAlive() == 1
+        except libvirt.libvirtError:
+            return False
+
+    @staticmethod
+    def close_connection(conn):
+        try:
+            conn.unregisterCloseCallback()
+            conn.close()
+        except libvirt.libvirtError:
+            pass
+
+    def get(self, key, url):
+        self.start_reaper()
+        with self.lock:
+            if key in self.connections:
+                conn, _ = self.connections[key]
+                if self.is_alive(conn):
+                    self.connections[key] = (conn, monotonic())
+                    return conn
+                del self.connections[key]
+                self.close_connection(conn)
+
+        libvirt_events.start()
+        conn = libvirt.open(url)
+        conn.setKeepAlive(self.KEEPALIVE_INTERVAL, self.KEEPALIVE_COUNT)
+        conn.registerCloseCallback(self.on_close, key)
+
+        with self.lock:
+            if key in self.connections:
+                self.close_connection(conn)
+                conn, _ = self.connections[key]
+            self.connections[key] = (conn, monotonic())
+            return conn
+
+    def on_close(self, conn, _reason, key):
+        with self.lock:
+            if key in self.connections and self.connections[key][0] is conn:
+                del self.connections[key]
+
+    def start_reaper(self):
+        with self.lock:
+            if self.reaper is None:
+                self.reaper = Thread(target=self.reap, name="libvirt-pool", daemon=True)
+                self.reaper.start()
+
+    def reap(self):
+        while True:
+            sleep(self.idle_timeout / 2)
+            self.evict_idle()
+
+    def evict_idle(self):
+        deadline = monotonic() - self.idle_timeout
+        self.close(lambda key: self.connections[key][1] < deadline)
+
+    def close(self, predicate=lambda _: True):
+        with self.lock:
+            keys = [k for k in self.connections if predicate(k)]
+            expired = [self.connections.pop(key)[0] for key in keys]
+        for conn in expired:
+            self.close_connection(conn)
+
+
+libvirt_pool = LibvirtConnectionPool()
@@ -0,0 +1,54 @@
+from sqlalchemy import select, tuple_
+
+PER_PAGE = 20
+MAX_PER_PAGE = 100
+
+
+class KeysetPage:
+    def __init__(self, items, has_prev, has_next):
+        self.items = items
+        self.has_prev = has_prev
+        self.has_next = has_next
+
+    @property
+    def prev_cursor(self):
+        return self.items[0].id if self.items else None
+
+    @property
+    def next_cursor(self):
+        return self.items[-1].id if self.items else None
+
+
+def paginate_keyset(
+    query,
+    sort_column,
+    id_column,
+    descending=False,
+    after=None,
+    before=None,
+    per_page=PER_PAGE,
+):
+    key = tuple_(sort_column, id_column)
+    backwards = before is not None and after is None
+    cursor = before if backwards else after
+    if cursor is not None:
+        anchor_value = (
+            select(sort_column)
+            .where(id_column == cursor)
+            .correlate(None)
+            .scalar_subquery()
+        )
+        anchor = tuple_(anchor_value, cursor)
+        query = query.filter(key < anchor if descending != backwards else key > anchor)
+
+    if descending != backwards:
+        query = query.order_by(sort_column.desc(), id_column.desc())
+    else:
+        query = query.order_by(sort_column.asc(), id_column.asc())
+
+    items = query.limit(per_page + 1).all()
+    has_more = len(items) > per_page
+    items = items[:per_page]
+    if backwards:
+        return KeysetPage(items[::-1], has_prev=has_more, has_next=True)
+    return KeysetPage(items, has_prev=cursor is not None, has_next=has_more)
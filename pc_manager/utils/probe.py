@@ -0,0 +1,19 @@
+import socket
+
+SSH_PORT = 22
+MAX_BANNER_LINES = 8
+
+
+def probe_ssh(hostname, read_banner=True, port=SSH_PORT, timeout=None):
+    with socket.create_connection((hostname, port), timeout=timeout) as sock:
+        if not read_banner:
+            return True
+
+        server_lines = sock.makefile("rb")
+        for _ in range(MAX_BANNER_LINES):
+            line = server_lines.readline(255)
+            if not line:
+                return False
+            if line.startswith(b"SSH-"):
+                return True
+        return False
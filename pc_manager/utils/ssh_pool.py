@@ -0,0 +1,138 @@
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from threading import Condition, Thread
+from time import monotonic, sleep
+
+from utils import lazy_import
+
+paramiko = lazy_import("paramiko")
+
+
+class SshConnectionPool:
+    KEEPALIVE_INTERVAL = 15
+    IDLE_TIMEOUT = 120
+    MAX_PER_HOST = 4
+
+    def __init__(
+        self,
+        keepalive_interval=KEEPALIVE_INTERVAL,
+        idle_timeout=IDLE_TIMEOUT,
+        max_per_host=MAX_PER_HOST,
+    ):
+        self.keepalive_interval = keepalive_interval
+        self.idle_timeout = idle_timeout
+        self.max_per_host = max_per_host
+
+        self.condition = Condition()
+        self.idle = defaultdict(list)
+        self.in_use = Counter()
+        self.generations = Counter()
+        self.reaper = None
+
+    @staticmethod
+    def is_alive(ssh_client):
+        transport = ssh_client.get_transport()
+        return transport is not None and transport.is_active()
+
+    @classmethod
+    def probe(cls, ssh_client):
+        if not cls.is_alive(ssh_client):
+            return False
+        try:
+            ssh_client.get_transport().send_ignore()
+            return True
+        except (EOFError, OSError, paramiko.SSHException):
+            return False
+
+    @contextmanager
+    def connection(self, key, connect, reuse=True, fresh=False):
+        generation = self.generations[key]
+        ssh_client = self.acquire(key, connect, fresh)
+        try:
+            yield ssh_client
+        except Exception:
+            self.release(key, ssh_client, generation, reuse=False)
+            raise
+        else:
+            self.release(key, ssh_client, generation, reuse=reuse)
+
+    def acquire(self, key, connect, fresh=False):
+        self.start_reaper()
+        with self.condition:
+            while self.in_use[key] >= self.max_per_host:
+                self.condition.wait()
+            self.in_use[key] += 1
+
+        try:
+            # Probe outside the lock, the slot reserved above keeps the limit.
+            while not fresh and (ssh_client := self.take_idle(key)) is not None:
+                if self.probe(ssh_client):
+                    return ssh_client
+                ssh_client.close()
+
+            ssh_client = connect()
+            ssh_client.get_transport().set_keepalive(self.keepalive_interval)
+            return ssh_client
+        except BaseException:
+            with self.condition:
+                self.in_use[key] -= 1
+                self.condition.notify()
+            raise
+
+    def take_idle(self, key):
+        with self.condition:
+            if not self.idle.get(key):
+                return None
+            (ssh_client, _) = self.idle[key].pop()
+            if not self.idle[key]:
+                del self.idle[key]
+            return ssh_client
+
+    def release(self, key, ssh_client, generation, reuse=True):
+        with self.condition:
+            self.in_use[key] -= 1
+            current = generation == self.generations[key]
+            if reuse and current and self.is_alive(ssh_client):
+                self.idle[key].append((ssh_client, monotonic()))
+                ssh_client = None
+            self.condition.notify()
+        if ssh_client is not None:
+            ssh_client.close()
+
+    def start_reaper(self):
+        with self.condition:
+            if self.reaper is None:
+                self.reaper = Thread(target=self.reap, name="ssh-pool", daemon=True)
+                self.reaper.start()
+
+    def reap(self):
+        while True:
+            sleep(self.idle_timeout / 2)
+            self.evict_idle()
+
+    def evict_idle(self):
+        deadline = monotonic() - self.idle_timeout
+        expired = []
+        with self.condition:
+            for key, connections in list(self.idle.items()):
+                expired += [c for c, last_used in connections if last_used < deadline]
+                self.idle[key] = [c for c in connections if c[1] >= deadline]
+                if not self.idle[key]:
+                    del self.idle[key]
+        for ssh_client in expired:
+            ssh_client.close()
+
+    def close(self, predicate=lambda _: True):
+        # Connections in use when this runs are closed on release instead of
+        # being returned to the pool.
+        expired = []
+        with self.condition:
+            keys = set(self.idle) | set(self.in_use) | set(self.generations)
+            for key in [k for k in keys if predicate(k)]:
+                self.generations[key] += 1
+                expired += [ssh_client for ssh_client, _ in self.idle.pop(key, [])]
+        for ssh_client in expired:
+            ssh_client.close()
+
+
+ssh_pool = SshConnectionPool()
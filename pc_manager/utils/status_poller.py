@@ -0,0 +1,141 @@
+from heapq import heappop, heappush
+from logging import exception
+from math import inf
+from threading import Condition, Thread
+from time import monotonic
+
+from utils.status_refresh import (
+    probe_statuses,
+    select_finished_jobs,
+    select_machine_ids,
+    write_statuses,
+)
+
+
+class StatusPoller(Thread):
+    FAST_INTERVAL = 5
+    BASE_INTERVAL = 30
+    SLOW_INTERVAL = 600
+    FAST_PERIOD = 60
+    SYNC_INTERVAL = 60
+    JOB_CHECK_INTERVAL = 5
+
+    def __init__(self):
+        super().__init__(name="status-poller", daemon=True)
+        self.app = None
+        self.condition = Condition()
+
+        self.heap = []
+        self.due = {}
+        self.intervals = {}
+        self.statuses = {}
+        self.fast_until = {}
+        self.next_sync = 0
+        self.next_job_check = 0
+        self.jobs_since = None
+
+    def start(self, app):
+        self.app = app
+        super().start()
+
+    def serve(self, app):
+        self.app = app
+        self.run()
+
+    def schedule(self, machine_id, delay):
+        due = monotonic() + delay
+        self.due[machine_id] = due
+        heappush(self.heap, (due, machine_id))
+
+    def expedite(self, machine_id):
+        with self.condition:
+            self.fast_until[machine_id] = monotonic() + self.FAST_PERIOD
+            self.intervals[machine_id] = self.FAST_INTERVAL
+            self.schedule(machine_id, 0)
+            self.condition.notify()
+
+    def expedite_finished_jobs(self):
+        # Jobs run in the web workers, so pick up their power changes from the
+        # database rather than waiting for the next regular poll.
+        with self.app.app_context():
+            machine_ids, self.jobs_since = select_finished_jobs(self.jobs_since)
+        for machine_id in machine_ids:
+            self.expedite(machine_id)
+        self.next_job_check = monotonic() + self.JOB_CHECK_INTERVAL
+
+    def pop_due(self):
+        now = monotonic()
+        batch = []
+        while self.heap and self.heap[0][0] <= now:
+            due, machine_id = heappop(self.heap)
+            if self.due.get(machine_id) == due:
+                del self.due[machine_id]
+                batch.append(machine_id)
+        return batch
+
+    def next_interval(self, machine_id, status):
+        if self.fast_until.get(machine_id, 0) > monotonic():
+            return self.FAST_INTERVAL
+        self.fast_until.pop(machine_id, None)
+
+        if status is None or status == self.statuses.get(machine_id):
+            interval = self.intervals.get(machine_id, self.BASE_INTERVAL) * 2
+            return min(max(interval, self.BASE_INTERVAL), self.SLOW_INTERVAL)
+        return self.BASE_INTERVAL
+
+    def sync_machines(self, machine_ids):
+        known = set(self.intervals)
+        for machine_id in known.difference(machine_ids):
+            for state in (self.due, self.intervals, self.statuses, self.fast_until):
+                state.pop(machine_id, None)
+        for index, machine_id in enumerate(set(machine_ids).difference(known)):
+            self.intervals[machine_id] = self.BASE_INTERVAL
+            self.schedule(machine_id, index % self.BASE_INTERVAL)
+        self.next_sync = monotonic() + self.SYNC_INTERVAL
+
+    def poll(self):
+        if monotonic() >= self.next_sync:
+            with self.app.app_context():
+                machine_ids = select_machine_ids()
+            with self.condition:
+                self.sync_machines(machine_ids)
+
+        if monotonic() >= self.next_job_check:
+            self.expedite_finished_jobs()
+
+        with self.condition:
+            batch = self.pop_due()
+            if not batch:
+                next_due = self.heap[0][0] if self.heap else inf
+                next_check = min(next_due, self.next_sync, self.next_job_check)
+                timeout = next_check - monotonic()
+                self.condition.wait(max(timeout, 0))
+                return
+
+        with self.app.app_context():
+            statuses = probe_statuses(batch)
+            write_statuses(statuses)
+
+        with self.condition:
+            for machine_id in batch:
+                if machine_id not in self.intervals:
+                    continue
+                status = statuses.get(machine_id)
+                interval = self.next_interval(machine_id, status)
+                self.intervals[machine_id] = interval
+                if status is not None:
+                    self.statuses[machine_id] = status
+                if machine_id not in self.due:
+                    self.schedule(machine_id, interval)
+
+    def run(self):
+        while True:
+            try:
+                self.poll()
+            except Exception:
+                exception("Status poller iteration failed")
+                with self.condition:
+                    self.condition.wait(self.FAST_INTERVAL)
+
+
+status_poller = StatusPoller()
@@ -0,0 +1,168 @@
+from collections import defaultdict, deque
+from datetime import datetime
+from logging import warning
+from queue import Empty, SimpleQueue
+from threading import Thread
+from time import monotonic
+
+from flask import current_app
+from sqlalchemy import bindparam, case, update
+
+from app import db
+from model.base import MachineStatus
+from model.hardware_features import LibvirtGuest
+from model.job import Job
+from model.machine import Machine
+
+MAX_WORKERS = 16
+HOST_TIMEOUT = 10
+
+
+def select_machine_ids(ids=None, place=None, status=None):
+    query = Machine.query.with_entities(Machine.id)
+    if ids:
+        query = query.filter(Machine.id.in_(ids))
+    if place:
+        query = query.filter(Machine.place == place)
+    if status:
+        query = query.filter(Machine.last_status == status)
+    return [id for (id,) in query.order_by(Machine.id)]
+
+
+def select_finished_jobs(since=None):
+    if since is None:
+        latest = db.session.query(db.func.max(Job.finished_time)).scalar()
+        return [], latest or datetime.min
+    jobs = (
+        Job.query.with_entities(Job.machine_id, Job.finished_time)
+        .filter(Job.finished_time > since)
+        .all()
+    )
+    latest = max((finished_time for (_, finished_time) in jobs), default=since)
+    return [machine_id for (machine_id, _) in jobs], latest
+
+
+def probe_machine(app, machine_id):
+    with app.app_context():
+        try:
+            machine = Machine.query.get(machine_id)
+            return {machine_id: machine.get_status(use_cache=False)} if machine else {}
+        except Exception as exc:
+            warning("Status probe failed for machine %s: %s", machine_id, exc)
+            return {machine_id: MachineStatus.UNKNOWN}
+        finally:
+            db.session.remove()
+
+
+def probe_libvirt_host(app, guest_ids):
+    with app.app_context():
+        try:
+            guests = LibvirtGuest.query.filter(LibvirtGuest.id.in_(guest_ids)).all()
+            statuses = LibvirtGuest.get_bulk_status(guests)
+            return {
+                guest.machine_id: statuses[guest.id]
+                for guest in guests
+                if statuses[guest.id] != MachineStatus.UNKNOWN
+            }
+        except Exception as exc:
+            warning("Bulk status probe failed for guests %s: %s", guest_ids, exc)
+            return {}
+        finally:
+            db.session.remove()
+
+
+def run_probes(probe, probe_args, max_workers, host_timeout):
+    if not probe_args:
+        return {}
+
+    app = current_app._get_current_object()
+    results = SimpleQueue()
+    pending = deque(enumerate(probe_args))
+    deadlines = {}
+    statuses = {}
+
+    def run(index, arg):
+        results.put((index, probe(app, arg)))
+
+    while pending or deadlines:
+        while pending and len(deadlines) < max_workers:
+            index, arg = pending.popleft()
+            deadlines[index] = monotonic() + host_timeout
+            Thread(target=run, args=(index, arg), daemon=True).start()
+
+        try:
+            timeout = max(min(deadlines.values()) - monotonic(), 0)
+            index, result = results.get(timeout=timeout)
+            if deadlines.pop(index, None) is not None:
+                statuses |= result
+        except Empty:
+            pass
+
+        now = monotonic()
+        for index in [i for i, deadline in deadlines.items() if deadline <= now]:
+            warning("Status probe timed out for %s", probe_args[index])
+            del deadlines[index]
+    return statuses
+
+
+def group_guests_by_host(machine_ids):
+    guests = LibvirtGuest.query.with_entities(LibvirtGuest.id, LibvirtGuest.host_id)
+    guests_by_host = defaultdict(list)
+    for guest_id, host_id in guests.filter(LibvirtGuest.machine_id.in_(machine_ids)):
+        guests_by_host[host_id].append(guest_id)
+    return list(guests_by_host.values())
+
+
+def probe_statuses(machine_ids, max_workers=MAX_WORKERS, host_timeout=HOST_TIMEOUT):
+    if not machine_ids:
+        return {}
+
+    guest_groups = group_guests_by_host(machine_ids)
+    statuses = run_probes(probe_libvirt_host, guest_groups, max_workers, host_timeout)
+
+    remaining = [id for id in machine_ids if id not in statuses]
+    statuses |= run_probes(probe_machine, remaining, max_workers, host_timeout)
+    return statuses
+
+
+def write_statuses(statuses, status_time=None):
+    if not statuses:
+        return
+    status_time = status_time or datetime.now()
+    db.session.execute(
+        update(Machine.__table__)
+        .where(Machine.id == bindparam("machine_id"))
+        .values(
+            last_status=bindparam("status"),
+            last_status_time=bindparam("status_time"),
+            version=case(
+                (Machine.last_status != bindparam("status"), Machine.version + 1),
+                else_=Machine.version,
+            ),
+        ),
+        [
+            {"machine_id": id, "status": status, "status_time": status_time}
+            for id, status in statuses.items()
+        ],
+    )
+    db.session.commit()
+
+
+def refresh_machine_statuses(
+    machine_ids, max_workers=MAX_WORKERS, host_timeout=HOST_TIMEOUT
+):
+    statuses = probe_statuses(machine_ids, max_workers, host_timeout)
+    write_statuses(statuses)
+    return statuses
+
+
+def refresh_statuses(
+    ids=None,
+    place=None,
+    status=None,
+    max_workers=MAX_WORKERS,
+    host_timeout=HOST_TIMEOUT,
+):
+    machine_ids = select_machine_ids(ids, place, status)
+    statuses = refresh_machine_statuses(machine_ids, max_workers, host_timeout)
+    return machine_ids, statuses
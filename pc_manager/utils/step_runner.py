@@ -0,0 +1,41 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+
+from app import db
+
+MAX_BRANCHES = 8
+
+
+def execute_step(machine, step):
+    argument = [step["argument"]] if step.get("argument") else []
+    machine.execute_action(step["op_name"], argument)
+
+
+def execute_parallel(machine, branches, max_workers=MAX_BRANCHES):
+    app = current_app._get_current_object()
+    machine_class, machine_id = type(machine), machine.id
+
+    def execute_branch(branch):
+        with app.app_context():
+            try:
+                execute_operations(machine_class.query.get(machine_id), branch)
+                db.session.commit()
+            finally:
+                db.session.remove()
+
+    # Branches use their own sessions. End this transaction first, so the thread
+    # waiting on them does not keep a pooled connection checked out.
+    db.session.commit()
+    with ThreadPoolExecutor(max_workers=min(len(branches), max_workers)) as executor:
+        futures = [executor.submit(execute_branch, branch) for branch in branches]
+        for future in futures:
+            future.result()
+
+
+def execute_operations(machine, operations):
+    for op in operations:
+        if "parallel" in op:
+            execute_parallel(machine, op["parallel"])
+        else:
+            execute_step(machine, op)
@@ -0,0 +1,39 @@
+from base64 import b64encode
+from os import environ
+
+import pytest
+
+TEST_DB_URL = environ.get("PC_MANAGER_TEST_DB_URL")
+
+if TEST_DB_URL:
+    environ["PC_MANAGER_DB_URL"] = TEST_DB_URL
+environ.setdefault("PC_MANAGER_USERNAME", "admin")
+environ.setdefault("PC_MANAGER_PASSWORD", "admin")
+
+
+@pytest.fixture
+def app():
+    if not TEST_DB_URL:
+        pytest.skip("PC_MANAGER_TEST_DB_URL is not set")
+
+    from app import create_app, db
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        try:
+            yield app
+        finally:
+            db.session.remove()
+            db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def auth_headers():
+    credentials = f"{environ['PC_MANAGER_USERNAME']}:{environ['PC_MANAGER_PASSWORD']}"
+    return {"Authorization": f"Basic {b64encode(credentials.encode()).decode()}"}
@@ -0,0 +1,95 @@
+import pytest
+
+
+def step(op_name, argument=None, group=None):
+    return {"op_name": op_name, "argument": argument, "group": group}
+
+
+class FakeCustomOperation:
+    def __init__(self, name, ops, plan=None):
+        self.name = name
+        self.ops = ops
+        self.plan = plan
+
+
+def test_compile_plan_inlines_nested_operations():
+    from model.custom_operation import compile_plan
+
+    ops_by_name = {
+        "outer": [step("start"), step("inner"), step("shutdown")],
+        "inner": [step("middle"), step("execute_command", "uptime")],
+        "middle": [step("get_status")],
+    }
+
+    assert compile_plan("outer", ops_by_name) == [
+        {"op_name": "start", "argument": None},
+        {"op_name": "get_status", "argument": None},
+        {"op_name": "execute_command", "argument": "uptime"},
+        {"op_name": "shutdown", "argument": None},
+    ]
+
+
+def test_compile_plan_groups_parallel_steps():
+    from model.custom_operation import compile_plan
+
+    ops_by_name = {
+        "outer": [step("start", group="a"), step("inner", group="a"), step("reboot")],
+        "inner": [step("get_status"), step("suspend")],
+    }
+
+    assert compile_plan("outer", ops_by_name) == [
+        {
+            "parallel": [
+                [{"op_name": "start", "argument": None}],
+                [
+                    {"op_name": "get_status", "argument": None},
+                    {"op_name": "suspend", "argument": None},
+                ],
+            ]
+        },
+        {"op_name": "reboot", "argument": None},
+    ]
+
+
+@pytest.mark.parametrize(
+    "ops_by_name, cycle",
+    [
+        ({"a": [step("a")]}, "a -> a"),
+        ({"a": [step("b")], "b": [step("c")], "c": [step("a")]}, "a -> b -> c -> a"),
+    ],
+)
+def test_compile_plan_rejects_cycles(ops_by_name, cycle):
+    from model.custom_operation import compile_plan
+
+    with pytest.raises(ValueError, match=cycle):
+        compile_plan("a", ops_by_name)
+
+
+def test_compile_plan_rejects_unknown_steps():
+    from model.custom_operation import compile_plan
+
+    ops_by_name = {"outer": [step("inner")], "inner": [step("missing")]}
+
+    with pytest.raises(ValueError, match="'inner' uses unknown step 'missing'"):
+        compile_plan("outer", ops_by_name)
+
+
+def test_recompile_plans_skips_broken_legacy_operations():
+    from model.custom_operation import recompile_plans
+
+    legacy = FakeCustomOperation("legacy", [step("legacy")])
+    changed = FakeCustomOperation("changed", [step("start")])
+
+    recompile_plans([legacy, changed], changed)
+    assert legacy.plan is None
+    assert changed.plan == [{"op_name": "start", "argument": None}]
+
+
+def test_recompile_plans_rejects_breaking_compiled_operations():
+    from model.custom_operation import recompile_plans
+
+    compiled = FakeCustomOperation("compiled", [step("changed")], plan=[])
+    changed = FakeCustomOperation("changed", [step("compiled")])
+
+    with pytest.raises(ValueError, match="includes itself"):
+        recompile_plans([compiled, changed], changed)
@@ -0,0 +1,31 @@
+import pytest
+
+LEGACY_KEY = "legacy secret key"
+
+
+def test_reencrypt_upgrades_legacy_values_to_current_key():
+    from utils.encryption import Keyring, make_legacy_engine
+
+    legacy_value = make_legacy_engine(LEGACY_KEY).encrypt("password")
+    keyring = Keyring({"1": "first key"}, "1", legacy_key=LEGACY_KEY)
+
+    assert not keyring.is_current(legacy_value)
+    upgraded = keyring.reencrypt(legacy_value)
+    assert upgraded.startswith("1$")
+    assert keyring.decrypt(upgraded) == "password"
+    assert keyring.reencrypt(upgraded) == upgraded
+    assert keyring.reencrypt(None) is None
+
+
+def test_reencrypt_rotates_values_to_current_key():
+    from utils.encryption import Keyring
+
+    keys = {"1": "first key", "2": "second key"}
+    old_value = Keyring(keys, "1").encrypt("password")
+    keyring = Keyring(keys, "2")
+
+    rotated = keyring.reencrypt(old_value)
+    assert rotated.startswith("2$")
+    assert keyring.decrypt(rotated) == "password"
+    with pytest.raises(ValueError):
+        Keyring({"2": "second key"}, "2").decrypt(old_value)
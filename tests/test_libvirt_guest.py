@@ -0,0 +1,39 @@
+from time import monotonic
+from uuid import UUID
+
+import pytest
+
+libvirt = pytest.importorskip("libvirt")
+
+# Well below both the one second sleep used without events and the event timeout.
+EVENT_LATENCY = 0.5
+
+
+@pytest.fixture
+def test_domain():
+    from utils.libvirt_events import libvirt_events
+
+    libvirt_events.start()
+    conn = libvirt.open("test:///default")
+    domain = conn.lookupByName("test")
+    try:
+        yield domain
+    finally:
+        if not domain.isActive():
+            domain.create()
+        conn.close()
+
+
+def test_ensure_status_returns_on_lifecycle_event(test_domain):
+    from model.base import MachineStatus
+    from model.hardware_features import LibvirtGuest
+
+    guest = LibvirtGuest(None, UUID(bytes=test_domain.UUID()))
+    guest.get_domain = lambda: test_domain
+    guest.get_status = lambda use_cache=True: LibvirtGuest.get_domain_status(
+        test_domain.state()[0]
+    )
+
+    started = monotonic()
+    assert guest.ensure_status(MachineStatus.POWER_OFF) == MachineStatus.POWER_OFF
+    assert monotonic() - started < EVENT_LATENCY
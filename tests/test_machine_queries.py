@@ -0,0 +1,101 @@
+from contextlib import contextmanager
+from uuid import uuid4
+
+from sqlalchemy import event
+
+MACHINE_COUNT = 10
+
+
+def add_machines(count, start=0):
+    from app import db
+    from model.credential import Password
+    from model.custom_operation import CustomOperation
+    from model.hardware_features import LibvirtGuest, WakeOnLan
+    from model.machine import Machine
+    from model.software_platform import LinuxPlatform
+
+    for i in range(start, start + count):
+        credential = Password(f"credential-{i}", "user", "secret")
+        custom_op = CustomOperation(
+            f"op-{i}", "Custom operation", [{"op_name": "get_status"}]
+        )
+        db.session.add_all([credential, custom_op])
+        db.session.flush()
+
+        host_platform = LinuxPlatform(f"host-{i}.local", credential.id)
+        host = Machine(
+            f"host-{i}",
+            "lab",
+            WakeOnLan(f"00:00:00:00:{i // 256:02x}:{i % 256:02x}"),
+            [host_platform],
+            [custom_op],
+        )
+        db.session.add(host)
+        db.session.flush()
+
+        guest = Machine(
+            f"guest-{i}",
+            "lab",
+            LibvirtGuest(host_platform.id, uuid4()),
+            [LinuxPlatform(f"guest-{i}.local", credential.id)],
+            [custom_op],
+        )
+        db.session.add(guest)
+    db.session.commit()
+
+
+@contextmanager
+def count_statements():
+    from app import db
+
+    statements = []
+
+    def on_execute(_conn, _cursor, statement, *_):
+        statements.append(statement)
+
+    event.listen(db.engine, "after_cursor_execute", on_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, "after_cursor_execute", on_execute)
+
+
+def count_list_page_statements(client, auth_headers):
+    with count_statements() as statements:
+        response = client.get("/?per_page=100", headers=auth_headers)
+    assert response.status_code == 200
+    return len(statements)
+
+
+def test_machine_list_query_count_does_not_grow_with_machines(
+    app, client, auth_headers
+):
+    add_machines(1)
+    client.get("/", headers=auth_headers)
+    single = count_list_page_statements(client, auth_headers)
+
+    add_machines(MACHINE_COUNT - 1, start=1)
+    assert count_list_page_statements(client, auth_headers) == single
+
+
+def test_query_with_providers_loads_list_page_data_up_front(app):
+    from app import db
+    from model.machine import Machine
+
+    add_machines(MACHINE_COUNT)
+    db.session.expunge_all()
+
+    with count_statements() as statements:
+        machines = Machine.query_with_providers().all()
+    loaded = len(statements)
+
+    with count_statements() as statements:
+        for machine in machines:
+            machine.hardware_features.get_properties()
+            for platform in machine.software_platforms:
+                platform.get_properties()
+            for custom_op in machine.custom_operations:
+                custom_op.get_plan()
+    assert len(machines) == 2 * MACHINE_COUNT
+    assert loaded > 0
+    assert statements == []
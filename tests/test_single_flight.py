@@ -0,0 +1,53 @@
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event
+from time import sleep
+
+import pytest
+
+CALLERS = 4
+SETTLE_TIME = 0.1
+
+
+def run_concurrently(single_flight, func, release):
+    with ThreadPoolExecutor(max_workers=CALLERS) as executor:
+        futures = [
+            executor.submit(single_flight.do, "key", func) for _ in range(CALLERS)
+        ]
+        sleep(SETTLE_TIME)
+        release.set()
+    return futures
+
+
+def test_concurrent_callers_share_one_call():
+    from utils.single_flight import SingleFlight
+
+    single_flight = SingleFlight()
+    release, calls = Event(), []
+
+    def func():
+        calls.append(None)
+        release.wait()
+        return "result"
+
+    futures = run_concurrently(single_flight, func, release)
+    assert [future.result() for future in futures] == ["result"] * CALLERS
+    assert len(calls) == 1
+    assert single_flight.calls == {}
+    assert single_flight.do("key", lambda: "next") == "next"
+
+
+def test_concurrent_callers_share_the_exception():
+    from utils.single_flight import SingleFlight
+
+    single_flight = SingleFlight()
+    release = Event()
+
+    def func():
+        release.wait()
+        raise ValueError("failed")
+
+    futures = run_concurrently(single_flight, func, release)
+    for future in futures:
+        with pytest.raises(ValueError, match="failed"):
+            future.result()
+    assert single_flight.calls == {}
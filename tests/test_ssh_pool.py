@@ -0,0 +1,40 @@
+class FakeTransport:
+    def __init__(self):
+        self.active = True
+
+    def is_active(self):
+        return self.active
+
+    def set_keepalive(self, _interval):
+        pass
+
+    def send_ignore(self):
+        pass
+
+
+class FakeSshClient:
+    def __init__(self):
+        self.transport = FakeTransport()
+
+    def get_transport(self):
+        return self.transport
+
+    def close(self):
+        self.transport.active = False
+
+
+def test_close_discards_connections_in_use():
+    from utils.ssh_pool import SshConnectionPool
+
+    pool = SshConnectionPool()
+
+    with pool.connection("stale", FakeSshClient) as stale:
+        with pool.connection("other", FakeSshClient) as other:
+            pool.close(lambda key: key == "stale")
+
+    assert not stale.get_transport().is_active()
+    assert other.get_transport().is_active()
+    with pool.connection("stale", FakeSshClient) as ssh_client:
+        assert ssh_client is not stale
+    with pool.connection("stale", FakeSshClient) as reused:
+        assert reused is ssh_client
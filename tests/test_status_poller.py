@@ -0,0 +1,35 @@
+from datetime import datetime, timedelta
+
+
+def add_machine_with_job(name, finished_time):
+    from app import db
+    from model.job import Job, JobStatus
+    from model.machine import Machine
+
+    machine = Machine(name, None, None, [], [])
+    job = Job(machine, "test")
+    job.status = JobStatus.SUCCEEDED
+    job.finished_time = finished_time
+    db.session.add_all([machine, job])
+    db.session.commit()
+    return machine.id
+
+
+def test_poller_expedites_machines_with_newly_finished_jobs(app):
+    from utils.status_poller import StatusPoller
+
+    earlier = datetime.now() - timedelta(minutes=5)
+    add_machine_with_job("earlier", earlier)
+    poller = StatusPoller()
+    poller.app = app
+
+    poller.expedite_finished_jobs()
+    assert poller.jobs_since == earlier
+    assert poller.due == {}
+
+    later = datetime.now()
+    machine_id = add_machine_with_job("later", later)
+    poller.expedite_finished_jobs()
+    assert poller.jobs_since == later
+    assert list(poller.due) == [machine_id]
+    assert poller.intervals[machine_id] == StatusPoller.FAST_INTERVAL
@@ -0,0 +1,40 @@
+def add_machine(name):
+    from app import db
+    from model.machine import Machine
+
+    machine = Machine(name, None, None, [], [])
+    db.session.add(machine)
+    db.session.commit()
+    return machine.id
+
+
+def get_version(machine_id):
+    from model.machine import Machine
+
+    return (
+        Machine.query.with_entities(Machine.version).filter_by(id=machine_id).scalar()
+    )
+
+
+def test_write_statuses_only_bumps_version_on_change(app):
+    from model.base import MachineStatus
+    from utils.status_refresh import write_statuses
+
+    machine_id = add_machine("machine")
+    version = get_version(machine_id)
+
+    write_statuses({machine_id: MachineStatus.UNKNOWN})
+    assert get_version(machine_id) == version
+
+    write_statuses({machine_id: MachineStatus.POWER_ON})
+    assert get_version(machine_id) == version + 1
+
+
+def test_machine_list_accepts_weak_etags(app, client, auth_headers):
+    add_machine("machine")
+    response = client.get("/api/machines", headers=auth_headers)
+    etag, _ = response.get_etag()
+
+    for if_none_match in (f'"{etag}"', f'W/"{etag}"'):
+        headers = dict(auth_headers, **{"If-None-Match": if_none_match})
+        assert client.get("/api/machines", headers=headers).status_code == 304
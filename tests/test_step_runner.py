@@ -0,0 +1,99 @@
+from threading import Lock
+from time import monotonic, sleep
+
+import pytest
+
+STEP_DURATION = 0.2
+
+
+class FakeMachine:
+    instances = {}
+
+    class query:
+        @staticmethod
+        def get(machine_id):
+            return FakeMachine.instances[machine_id]
+
+    def __init__(self, machine_id):
+        self.id = machine_id
+        self.lock = Lock()
+        self.calls = []
+        FakeMachine.instances[machine_id] = self
+
+    def execute_action(self, name, action_args):
+        if name == "fail":
+            raise Exception("step failed")
+        if name == "count_connections":
+            from app import db
+
+            action_args = [db.engine.pool.checkedout()]
+        sleep(STEP_DURATION if name.startswith("slow") else 0)
+        with self.lock:
+            self.calls.append((name, action_args))
+
+
+@pytest.fixture
+def app_context():
+    from app import create_app
+
+    with create_app().app_context():
+        yield
+
+
+def test_grouped_steps_run_in_parallel_between_sequential_steps(app_context):
+    from utils.step_runner import execute_operations
+
+    machine = FakeMachine(1)
+    plan = [
+        {"op_name": "first", "argument": None},
+        {
+            "parallel": [
+                [{"op_name": "slow_a", "argument": "a"}],
+                [{"op_name": "slow_b", "argument": None}],
+                [{"op_name": "slow_c", "argument": None}],
+            ]
+        },
+        {"op_name": "last", "argument": None},
+    ]
+
+    start = monotonic()
+    execute_operations(machine, plan)
+    elapsed = monotonic() - start
+
+    assert machine.calls[0] == ("first", [])
+    assert machine.calls[-1] == ("last", [])
+    assert sorted(machine.calls[1:-1]) == [
+        ("slow_a", ["a"]),
+        ("slow_b", []),
+        ("slow_c", []),
+    ]
+    assert elapsed < 2 * STEP_DURATION
+
+
+def test_failed_branch_fails_the_group(app_context):
+    from utils.step_runner import execute_operations
+
+    machine = FakeMachine(2)
+    plan = [
+        {"parallel": [[{"op_name": "fail"}], [{"op_name": "slow_a"}]]},
+        {"op_name": "last"},
+    ]
+
+    with pytest.raises(Exception, match="step failed"):
+        execute_operations(machine, plan)
+    assert ("last", []) not in machine.calls
+
+
+def test_caller_releases_its_connection_before_branches_run(app):
+    from sqlalchemy import text
+
+    from app import db
+    from utils.step_runner import execute_operations
+
+    machine = FakeMachine(3)
+    db.session.execute(text("SELECT 1"))
+    assert db.engine.pool.checkedout() == 1
+
+    branch = [{"op_name": "count_connections"}]
+    execute_operations(machine, [{"parallel": [branch, branch]}])
+    assert machine.calls == [("count_connections", [0])] * 2